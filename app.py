@@ -14,6 +14,151 @@ import streamlit as st
 from src.agent import ChiselAgent
 from src.llm_provider import PROVIDER_CONFIGS
 
+# 对话区默认只渲染最近的消息条数，点击 "加载更早的消息" 每次再扩展一个窗口
+HISTORY_WINDOW = 30
+
+# st.fragment 需要较新的 Streamlit，旧版本退化为普通函数
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda f: f)
+# st.toggle 需要 Streamlit >= 1.26，旧版本用 checkbox 代替
+_toggle = getattr(st, "toggle", st.checkbox)
+
+# 代码标签页默认只高亮前若干行，超出部分需要手动展开
+CODE_PREVIEW_LINES = 500
+
+# 状态框合并推送: Agent 产出后会立刻再产出下一步的状态可以先缓冲，
+# 与下一条一起推送；其余状态之后都跟着耗时的 LLM/编译调用，必须立即显示
+COALESCED_STATUSES = {"elaboration_passed", "tb_error", "sim_passed", "sim_failed", "tb_fix_failed"}
+TERMINAL_STATUSES = {"success", "failed", "error"}
+
+# 进度状态 -> 状态框图标 (终止状态单独处理)
+STATUS_ICONS = {
+    "generating": "✍️",
+    "reflecting": "🔨",
+    "fixing": "🚑",
+    "elaboration_passed": "✅",
+    "generating_tb": "🧪",
+    "fixing_tb": "🔧",
+    "tb_generated": "📝",
+    "tb_error": "⚠️",
+    "tb_compile_error": "🔧",
+    "tb_fix_failed": "⚠️",
+    "simulating": "🌊",
+    "sim_passed": "✅",
+    "sim_failed": "⚠️",
+}
+
+# 侧边栏 Provider 选项 (模块级常量，rerun 时不再重复构建列表和查找下标)
+PROVIDER_OPTIONS = {
+    "gemini": "🌟 Google Gemini",
+    "openai": "🟢 OpenAI (GPT)",
+    "qwen": "🔮 Qwen (通义千问)",
+    "deepseek": "🔷 DeepSeek",
+    "siliconflow": "🔮 SiliconFlow",
+    "claude": "🟣 Anthropic Claude",
+    "custom": "⚙️ 自定义 OpenAI 兼容"
+}
+PROVIDER_KEYS = tuple(PROVIDER_OPTIONS)
+# 各 Provider 默认模型在模型列表中的下标
+DEFAULT_MODEL_INDEX = {
+    name: cfg["models"].index(cfg["default_model"])
+    for name, cfg in PROVIDER_CONFIGS.items()
+    if cfg.get("default_model") in cfg.get("models", [])
+}
+
+
+def _flush_status(status_box, pending_lines):
+    """把缓冲的进度消息一次性写入状态框"""
+    if pending_lines:
+        status_box.write("\n\n".join(pending_lines))
+        pending_lines.clear()
+
+# ==================== 缓存资源 ====================
+def _get_agent(provider_type, api_key, model_name, base_url):
+    """
+    取当前会话的 Agent，配置不变时跨 rerun 复用，避免重建 LLM 客户端和 HTTP 连接池。
+    Agent 持有对话历史和系统提示词等可变状态，只能按会话保存在 session_state 中，
+    不能用进程级的 st.cache_resource 在多个用户会话之间共享
+    """
+    config = (provider_type, api_key, model_name, base_url)
+    if st.session_state.get("agent_config") != config:
+        st.session_state.agent = ChiselAgent.from_config(
+            provider_type=provider_type,
+            api_key=api_key,
+            model_name=model_name,
+            base_url=base_url
+        )
+        st.session_state.agent_config = config
+    return st.session_state.agent
+
+
+@st.cache_data(max_entries=16)
+def _vcd_to_wavedrom_cached(result_digest, _vcd_text, max_cycles=25):
+    """VCD 文本 -> WaveDrom JSON (按结果摘要缓存，rerun 时不再重复解析)"""
+    import io
+    from src.vcd_parser import vcd_to_wavedrom
+    return vcd_to_wavedrom(io.StringIO(_vcd_text), max_cycles=max_cycles)
+
+
+@st.cache_data(max_entries=16)
+def _wavedrom_html_cached(wavedrom_json, height=400):
+    """WaveDrom JSON -> 嵌入用 HTML"""
+    from src.vcd_parser import generate_wavedrom_html
+    return generate_wavedrom_html(wavedrom_json, height=height)
+
+@st.cache_data(max_entries=4)
+def _build_project_zip(result_digest, module_name, _code, _verilog, _testbench, _vcd, elaborated):
+    """打包项目文件为 zip 字节串"""
+    code, verilog, testbench, vcd = _code, _verilog, _testbench, _vcd
+    import io
+    import zipfile
+    
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+        zf.writestr(f"{module_name}.scala", code)
+        zf.writestr(f"{module_name}.v", verilog)
+        if testbench:
+            zf.writestr(f"tb_{module_name}.cpp", testbench)
+        if vcd:
+            zf.writestr(f"{module_name}.vcd", vcd)
+        # 添加 README
+        readme = f"""# {module_name}
+
+Generated by ChiseLLM
+
+## Files
+- {module_name}.scala - Chisel source code
+- {module_name}.v - Generated Verilog
+{"- tb_" + module_name + ".cpp - C++ Testbench (Verilator)" if testbench else ""}
+{"- " + module_name + ".vcd - Simulation waveform" if vcd else ""}
+
+## Verification Status
+- Elaboration: {"✅ Passed" if elaborated else "❌ Failed"}
+"""
+        zf.writestr("README.md", readme)
+    return zip_buffer.getvalue()
+
+# 详细报告中不展示的大字段 (在其它标签页已有展示)，以及长字符串的截断长度
+REPORT_EXCLUDE_KEYS = {"vcd_content", "full_stdout", "full_stderr", "testbench_code", "generated_verilog"}
+REPORT_MAX_STR_LEN = 2000
+
+
+@st.cache_data(max_entries=8)
+def _trimmed_report(result_digest, _result):
+    """过滤大字段并截断长字符串，得到用于 st.json 展示的精简报告"""
+    result = _result
+    return {
+        k: (v[:REPORT_MAX_STR_LEN] + "…" if isinstance(v, str) and len(v) > REPORT_MAX_STR_LEN else v)
+        for k, v in result.items()
+        if k not in REPORT_EXCLUDE_KEYS
+    }
+
+def _result_digest(result, code, testbench=None):
+    """结果内容摘要: 存入 session 时只计算一次，之后作为各缓存函数的键，
+    rerun 时 st.cache_data 不必再逐次哈希整份结果 (VCD/Verilog 可能很大)"""
+    import hashlib
+    payload = "\0".join((repr(result), code or "", testbench or ""))
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
 # ==================== 页面配置 ====================
 st.set_page_config(
     page_title="ChiseLLM Workstation", 
@@ -76,20 +221,10 @@ with st.sidebar:
     # ========== 自定义配置模式 ==========
     else:
         # Provider 选择
-        provider_options = {
-            "gemini": "🌟 Google Gemini",
-            "openai": "🟢 OpenAI (GPT)",
-            "qwen": "🔮 Qwen (通义千问)",
-            "deepseek": "🔷 DeepSeek",
-            "siliconflow": "🔮 SiliconFlow",
-            "claude": "🟣 Anthropic Claude",
-            "custom": "⚙️ 自定义 OpenAI 兼容"
-        }
-        
         provider_type = st.selectbox(
             "选择 API 类型",
-            options=list(provider_options.keys()),
-            format_func=lambda x: provider_options[x]
+            options=PROVIDER_KEYS,
+            format_func=PROVIDER_OPTIONS.__getitem__
         )
         
         # API Key 输入
@@ -142,7 +277,7 @@ with st.sidebar:
                 model_name = st.selectbox(
                     "选择模型",
                     options=models,
-                    index=models.index(default_model) if default_model in models else 0
+                    index=DEFAULT_MODEL_INDEX.get(provider_type, 0)
                 )
             else:
                 model_name = st.text_input("模型名称", value=default_model)
@@ -153,7 +288,7 @@ with st.sidebar:
     if use_default and has_default:
         st.success("✅ 测试配置已就绪，可直接使用")
     elif api_key:
-        provider_display = provider_options.get(display_provider_type, display_provider_type)
+        provider_display = PROVIDER_OPTIONS.get(display_provider_type, display_provider_type)
         st.success(f"✅ 已配置 {provider_display}")
     else:
         st.warning("⚠️ 请输入 API Key 或启用测试配置")
@@ -181,6 +316,35 @@ if "last_code" not in st.session_state:
     st.session_state.last_code = None
 if "last_testbench" not in st.session_state:
     st.session_state.last_testbench = None
+if "history_window" not in st.session_state:
+    st.session_state.history_window = HISTORY_WINDOW
+if "opened_tabs" not in st.session_state:
+    st.session_state.opened_tabs = set()
+if "result_digest" not in st.session_state:
+    st.session_state.result_digest = None
+
+
+def _lazy_tab(name, label):
+    """重量级标签页按需加载: st.tabs 会执行所有标签页的内容，点击按钮后才真正渲染"""
+    opened = st.session_state.opened_tabs
+    if name in opened:
+        return True
+    st.button(label, key=f"load_{name}", on_click=opened.add, args=(name,))
+    return False
+
+
+def _render_code_truncated(text, language, key, limit=CODE_PREVIEW_LINES):
+    """长代码默认只渲染前 limit 行，减少浏览器端语法高亮和 DOM 开销"""
+    lines = text.splitlines()
+    if len(lines) > limit and not _toggle(f"显示全部 ({len(lines)} 行)", key=f"show_full_{key}"):
+        st.code("\n".join(lines[:limit]) + f"\n// ... (还有 {len(lines) - limit} 行)", language=language)
+    else:
+        st.code(text, language=language)
+
+
+def _load_earlier_messages():
+    """扩大历史消息的显示窗口"""
+    st.session_state.history_window += HISTORY_WINDOW
 
 # ... 上面的代码保持不变 ...
 
@@ -191,8 +355,15 @@ col_chat, col_code = st.columns([1, 1])
 with col_chat:
     st.subheader("💬 需求对话")
     
-    # 显示历史消息
-    for msg in st.session_state.messages:
+    # 显示历史消息 (只渲染最近 HISTORY_WINDOW 条，避免长会话每次 rerun 全量重绘)
+    history_window = st.session_state.history_window
+    if len(st.session_state.messages) > history_window:
+        st.button(
+            "⬆️ 加载更早的消息",
+            on_click=_load_earlier_messages,
+            use_container_width=True
+        )
+    for msg in st.session_state.messages[-history_window:]:
         with st.chat_message(msg["role"]):
             st.markdown(msg["content"])
 
@@ -212,50 +383,28 @@ if prompt := st.chat_input("请输入设计需求 (例如：写一个带同步
         with st.chat_message("assistant"):
             status_box = st.status("🚀 启动中...", expanded=True)
             
-            # 使用工厂方法创建 Agent
+            # 获取本会话的 Agent (同一配置复用客户端)
             try:
-                # ... 下面的代码保持原样，只需确保缩进正确 ...
-                agent = ChiselAgent.from_config(
-                    provider_type=provider_type,
-                    api_key=api_key,
-                    model_name=model_name,
-                    base_url=base_url
-                )
-            # ... (后续所有代码直到文件结束都需要保持在这个 with col_chat: 的缩进里) ...
+                agent = _get_agent(provider_type, api_key, model_name, base_url)
             except Exception as e:
                 st.error(f"创建 Agent 失败: {str(e)}")
                 st.stop()
             
+            # 会话内的 Agent 会跨请求复用，每次需求开始前清空对话历史
+            agent.provider.reset_chat()
+            
             response_content = ""
             testbench_code = None
+            pending_lines = []
             
             for step in agent.run_loop(prompt):
-                if step["status"] == "generating":
-                    status_box.write(f"✍️ {step['msg']}")
-                elif step["status"] == "reflecting":
-                    status_box.write(f"🔨 {step['msg']}")
-                elif step["status"] == "fixing":
-                    status_box.write(f"🚑 {step['msg']}")
-                elif step["status"] == "elaboration_passed":
-                    status_box.write(f"✅ {step['msg']}")
-                elif step["status"] == "generating_tb":
-                    status_box.write(f"🧪 {step['msg']}")
-                elif step["status"] == "fixing_tb":
-                    status_box.write(f"🔧 {step['msg']}")
-                elif step["status"] == "tb_generated":
-                    status_box.write(f"📝 {step['msg']}")
-                elif step["status"] == "tb_error":
-                    status_box.write(f"⚠️ {step['msg']}")
-                elif step["status"] == "tb_compile_error":
-                    status_box.write(f"🔧 {step['msg']}")
-                elif step["status"] == "tb_fix_failed":
-                    status_box.write(f"⚠️ {step['msg']}")
-                elif step["status"] == "simulating":
-                    status_box.write(f"🌊 {step['msg']}")
-                elif step["status"] == "sim_passed":
-                    status_box.write(f"✅ {step['msg']}")
-                elif step["status"] == "sim_failed":
-                    status_box.write(f"⚠️ {step['msg']}")
+                # 终止状态前先把缓冲的进度消息全部输出
+                if step["status"] in TERMINAL_STATUSES:
+                    _flush_status(status_box, pending_lines)
+                
+                icon = STATUS_ICONS.get(step["status"])
+                if icon:
+                    pending_lines.append(f"{icon} {step['msg']}")
                 elif step["status"] == "error":
                     status_box.update(label="❌ 发生错误", state="error")
                     st.error(step["msg"])
@@ -266,6 +415,10 @@ if prompt := st.chat_input("请输入设计需求 (例如：写一个带同步
                     st.session_state.last_result = step["result"]
                     st.session_state.last_code = step["code"]
                     st.session_state.last_testbench = step.get("testbench_code")
+                    st.session_state.result_digest = _result_digest(
+                        step["result"], step["code"], step.get("testbench_code")
+                    )
+                    st.session_state.opened_tabs = set()
                 elif step["status"] == "failed":
                     status_box.update(label="💀 任务失败，已显示最后一次错误报告", state="error")
                     st.error(step["msg"])
@@ -274,13 +427,22 @@ if prompt := st.chat_input("请输入设计需求 (例如：写一个带同步
                     if "result" in step:
                         st.session_state.last_result = step["result"]
                         st.session_state.last_code = step["code"]
+                        st.session_state.result_digest = _result_digest(
+                            step["result"], step["code"], st.session_state.last_testbench
+                        )
+                        st.session_state.opened_tabs = set()
+                
+                # 合并推送: 紧接着还有下一步的状态先缓冲，其余立即刷新
+                if step["status"] not in COALESCED_STATUSES:
+                    _flush_status(status_box, pending_lines)
             
             st.markdown(response_content)
             st.session_state.messages.append({"role": "assistant", "content": response_content})
-            st.rerun()
 
 # --- 右侧代码区 ---
-with col_code:
+@_fragment
+def render_code_panel():
+    """右侧代码工作区 (作为 fragment 独立重绘，不牵动对话区)"""
     st.subheader("💻 代码工作区")
     
     if st.session_state.get("last_result"):
@@ -288,6 +450,7 @@ with col_code:
         code = st.session_state.last_code
         testbench = st.session_state.last_testbench or result.get("testbench_code")
         module_name = result.get("module_name", "Module")
+        digest = st.session_state.result_digest
         
         tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
             "📐 Chisel 源码", 
@@ -299,11 +462,11 @@ with col_code:
         ])
         
         with tab1:
-            st.code(code, language="scala")
+            _render_code_truncated(code, "scala", "chisel")
         
         with tab2:
             if result.get("generated_verilog"):
-                st.code(result["generated_verilog"], language="verilog")
+                _render_code_truncated(result["generated_verilog"], "verilog", "verilog")
             else:
                 st.info("未生成 Verilog (elaboration 失败)")
         
@@ -311,7 +474,7 @@ with col_code:
             # Testbench 显示
             if testbench:
                 st.success("✅ C++ Testbench 已生成")
-                st.code(testbench, language="cpp")
+                _render_code_truncated(testbench, "cpp", "testbench")
             else:
                 st.info("💡 Testbench 将在代码验证通过后自动生成")
         
@@ -320,26 +483,18 @@ with col_code:
             if result.get("vcd_content"):
                 st.success("✅ 仿真波形已生成")
                 
-                # 使用 vcd_parser 转换并渲染
-                try:
-                    import tempfile
-                    import os
-                    import streamlit.components.v1 as components
-                    from src.vcd_parser import vcd_to_wavedrom, generate_wavedrom_html
-                    
-                    # 将 VCD 内容写入临时文件
-                    with tempfile.NamedTemporaryFile(mode='w', suffix='.vcd', delete=False) as f:
-                        f.write(result["vcd_content"])
-                        temp_vcd_path = f.name
-                    
+                if _lazy_tab("waveform", "🌊 加载波形"):
+                    # 使用 vcd_parser 转换并渲染 (内存解析 + 按内容缓存)
                     try:
+                        import streamlit.components.v1 as components
+                    
                         # 转换为 WaveDrom JSON
-                        wavedrom_json = vcd_to_wavedrom(temp_vcd_path, max_cycles=25)
-                        
+                        wavedrom_json = _vcd_to_wavedrom_cached(digest, result["vcd_content"], max_cycles=25)
+                    
                         # 检查返回值类型和错误
                         if isinstance(wavedrom_json, dict) and "error" not in wavedrom_json:
                             # 生成 HTML 并嵌入
-                            html_content = generate_wavedrom_html(wavedrom_json, height=400)
+                            html_content = _wavedrom_html_cached(wavedrom_json, height=400)
                             components.html(html_content, height=450, scrolling=True)
                         elif isinstance(wavedrom_json, dict) and "error" in wavedrom_json:
                             st.warning(f"波形解析警告: {wavedrom_json.get('error')}")
@@ -349,15 +504,11 @@ with col_code:
                             st.warning(f"波形解析返回了意外的数据类型: {type(wavedrom_json).__name__}")
                             st.info("显示原始 VCD 文件内容 (前 2000 字符)")
                             st.code(result["vcd_content"][:2000], language="text")
-                    finally:
-                        # 清理临时文件
-                        if os.path.exists(temp_vcd_path):
-                            os.unlink(temp_vcd_path)
                         
-                except Exception as e:
-                    st.error(f"波形渲染失败: {str(e)}")
-                    st.info("显示原始 VCD 文件")
-                    st.code(result["vcd_content"][:2000], language="text")
+                    except Exception as e:
+                        st.error(f"波形渲染失败: {str(e)}")
+                        st.info("显示原始 VCD 文件")
+                        st.code(result["vcd_content"][:2000], language="text")
             else:
                 st.info("💡 波形将在 Testbench 仿真完成后自动生成")
                 if testbench:
@@ -391,93 +542,79 @@ with col_code:
             
             # 显示详细报告
             with st.expander("📋 详细报告"):
-                # 过滤掉过大的字段
-                display_result = {k: v for k, v in result.items() 
-                                  if k not in ["vcd_content", "full_stdout", "full_stderr", "testbench_code"]}
-                st.json(display_result)
+                if _lazy_tab("report", "📋 加载详细报告"):
+                    st.json(_trimmed_report(digest, result), expanded=False)
         
         with tab6:
             # 下载中心
             st.markdown("### 📥 下载中心")
             
-            col_dl1, col_dl2 = st.columns(2)
+            if _lazy_tab("downloads", "📦 准备下载文件"):
+                col_dl1, col_dl2 = st.columns(2)
             
-            with col_dl1:
-                # Chisel 源码
-                st.download_button(
-                    "⬇️ Chisel 源码 (.scala)",
-                    code,
-                    file_name=f"{module_name}.scala",
-                    mime="text/plain",
-                    use_container_width=True
-                )
-                
-                # Verilog
-                if result.get("generated_verilog"):
+                with col_dl1:
+                    # Chisel 源码
                     st.download_button(
-                        "⬇️ Verilog (.v)",
-                        result["generated_verilog"],
-                        file_name=f"{module_name}.v",
+                        "⬇️ Chisel 源码 (.scala)",
+                        code,
+                        file_name=f"{module_name}.scala",
                         mime="text/plain",
                         use_container_width=True
                     )
                 
-                # Testbench
-                if testbench:
-                    st.download_button(
-                        "⬇️ Testbench (.cpp)",
-                        testbench,
-                        file_name=f"tb_{module_name}.cpp",
-                        mime="text/plain",
-                        use_container_width=True
-                    )
+                    # Verilog
+                    if result.get("generated_verilog"):
+                        st.download_button(
+                            "⬇️ Verilog (.v)",
+                            result["generated_verilog"],
+                            file_name=f"{module_name}.v",
+                            mime="text/plain",
+                            use_container_width=True
+                        )
+                
+                    # Testbench
+                    if testbench:
+                        st.download_button(
+                            "⬇️ Testbench (.cpp)",
+                            testbench,
+                            file_name=f"tb_{module_name}.cpp",
+                            mime="text/plain",
+                            use_container_width=True
+                        )
             
-            with col_dl2:
-                # VCD 波形
-                if result.get("vcd_content"):
-                    st.download_button(
-                        "⬇️ 波形文件 (.vcd)",
-                        result["vcd_content"],
-                        file_name=f"{module_name}.vcd",
-                        mime="text/plain",
-                        use_container_width=True
-                    )
+                with col_dl2:
+                    # VCD 波形
+                    if result.get("vcd_content"):
+                        st.download_button(
+                            "⬇️ 波形文件 (.vcd)",
+                            result["vcd_content"],
+                            file_name=f"{module_name}.vcd",
+                            mime="text/plain",
+                            use_container_width=True
+                        )
                 
-                # 项目打包 (Zip)
-                if result.get("generated_verilog"):
-                    import io
-                    import zipfile
+                    # 项目打包 (Zip，按内容缓存，内容不变时不重复压缩)
+                    if result.get("generated_verilog"):
+                        zip_bytes = _build_project_zip(
+                            digest,
+                            module_name,
+                            code,
+                            result["generated_verilog"],
+                            testbench,
+                            result.get("vcd_content"),
+                            result['elaborated']
+                        )
                     
-                    zip_buffer = io.BytesIO()
-                    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-                        zf.writestr(f"{module_name}.scala", code)
-                        zf.writestr(f"{module_name}.v", result["generated_verilog"])
-                        if testbench:
-                            zf.writestr(f"tb_{module_name}.cpp", testbench)
-                        if result.get("vcd_content"):
-                            zf.writestr(f"{module_name}.vcd", result["vcd_content"])
-                        # 添加 README
-                        readme = f"""# {module_name}
+                        st.download_button(
+                            "📦 下载项目包 (.zip)",
+                            zip_bytes,
+                            file_name=f"{module_name}_project.zip",
+                            mime="application/zip",
+                            use_container_width=True
+                        )
+    else:
+        st.info("👈 请在左侧输入需求")
 
-Generated by ChiseLLM
 
-## Files
-- {module_name}.scala - Chisel source code
-- {module_name}.v - Generated Verilog
-{"- tb_" + module_name + ".cpp - C++ Testbench (Verilator)" if testbench else ""}
-{"- " + module_name + ".vcd - Simulation waveform" if result.get("vcd_content") else ""}
-
-## Verification Status
-- Elaboration: {"✅ Passed" if result['elaborated'] else "❌ Failed"}
-"""
-                        zf.writestr("README.md", readme)
-                    
-                    st.download_button(
-                        "📦 下载项目包 (.zip)",
-                        zip_buffer.getvalue(),
-                        file_name=f"{module_name}_project.zip",
-                        mime="application/zip",
-                        use_container_width=True
-                    )
-    else:
-        st.info("👈 请在左侧输入需求")
\ No newline at end of file
+with col_code:
+    render_code_panel()
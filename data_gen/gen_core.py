@@ -0,0 +1,108 @@
+"""
+数据生成脚本的公共部分 (generator_V2.py、generate_missing_samples.py 与 merge_and_prepare.py 共用)
+
+- JSONL 解析与序列化 (orjson 可选)
+- 结构指纹与跨运行持久化的结构验证结论
+- 可用 CPU 数探测 (考虑亲和性与容器配额)
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import hashlib
+
+# 添加 src 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from reflect_env import MILL_BUILD_SC
+
+# orjson 为可选依赖: 解析/编码快数倍且直接处理 UTF-8 bytes，缺失时回退到标准库
+try:
+    import orjson
+
+    loads_line = orjson.loads
+
+    def dumps_line(obj):
+        """序列化为一行 JSONL (bytes)"""
+        return orjson.dumps(obj) + b"\n"
+except ImportError:
+    loads_line = json.loads
+
+    def dumps_line(obj):
+        """序列化为一行 JSONL (bytes)"""
+        return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+
+def shape_key(code, module_name, tags=()):
+    """
+    结构指纹: 去掉模块名 (以及 tags 中的各个生成标识) 后的代码哈希。只差这些名字的样本可编译性完全相同，只需验证一次。
+    tags 按顺序替换，较长的标识 (如包含样本编号的 Bundle 类名后缀) 应排在它所包含的短标识之前。
+    构建配置 (Chisel 版本等) 也计入哈希，升级依赖后旧的验证结论自动失效。
+    """
+    h = hashlib.blake2b(MILL_BUILD_SC.encode("utf-8"), digest_size=16)
+    # 先屏蔽标识再屏蔽模块名: 模块名可能是 Bundle 类名的前缀 (如 MyBundle_7 与 MyBundle_7_<tag>)
+    for tag in tags:
+        code = code.replace(tag, "__TAG__")
+    code = code.replace(module_name, "__MODULE__")
+    h.update(code.encode("utf-8"))
+    return h.hexdigest()
+
+# 跨运行持久化的结构验证结论 (结构指纹 -> 是否通过)，各生成脚本共用同一个库
+VALIDATION_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "chisellm", "validated.sqlite")
+
+def load_validation_cache(path=VALIDATION_CACHE_PATH):
+    """读取历史验证结论，返回 {结构指纹: bool}"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS validated (key TEXT PRIMARY KEY, ok INTEGER NOT NULL)")
+        return {key: bool(ok) for key, ok in conn.execute("SELECT key, ok FROM validated")}
+
+def save_validation_cache(verdicts, path=VALIDATION_CACHE_PATH):
+    """
+    写回验证结论 (只在主进程调用，避免多进程并发写 sqlite)。
+    verdicts 只应包含编译器/阐述器给出的确定结论; 结论未知 (None，如 Mill 超时) 的条目跳过，
+    否则一次环境故障会让这些结构在当前构建配置下被永久拒收
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS validated (key TEXT PRIMARY KEY, ok INTEGER NOT NULL)")
+        conn.executemany(
+            "INSERT OR REPLACE INTO validated (key, ok) VALUES (?, ?)",
+            [(key, int(ok)) for key, ok in verdicts.items() if ok is not None]
+        )
+
+def _cgroup_cpu_quota():
+    """读取 cgroup 的 CPU 配额 (可用核数，向下取整且至少为 1)，未设置配额时返回 None"""
+    # cgroup v2: cpu.max 内容为 "<quota> <period>"，quota 为 max 表示不限
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return max(1, int(quota) // int(period))
+        return None
+    except (OSError, ValueError):
+        pass
+    # cgroup v1: cfs_quota_us 为 -1 表示不限
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return max(1, quota // period)
+    except (OSError, ValueError):
+        pass
+    return None
+
+def available_cpus():
+    """
+    当前进程实际可用的 CPU 数。os.cpu_count() 返回的是宿主机核数，
+    在容器或设置了 CPU 亲和性时会高估，这里取亲和性掩码与 cgroup 配额中较小者
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        # 非 Linux 平台没有 sched_getaffinity
+        cpus = os.cpu_count() or 4
+    quota = _cgroup_cpu_quota()
+    return min(cpus, quota) if quota else cpus
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 专门生成现有数据集缺失的样本类型（多进程加速版）
-目标: Enum, PopCount, Reverse, Fill, Log2, PriorityEncoder, OHToUInt, UIntToOH, Mux1H
+目标: Enum (含 ChiselEnum 独热编码 FSM), PopCount, Reverse, Fill, Log2, PriorityEncoder, OHToUInt, UIntToOH, Mux1H
 
 根据分析，现有 10000 条数据集:
 - Cat(): 550 条 ✅
@@ -12,257 +12,309 @@
 
 import sys
 import os
-import json
 import random
 import multiprocessing
+import itertools
+import shutil
+import tempfile
 from datetime import datetime
 from tqdm import tqdm
 
 # 添加 src 到路径
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
-from reflect_env import reflect
-from jinja2 import Template
+from reflect_env import close_workspace, reflect_batch
+from gen_core import available_cpus, dumps_line, shape_key, load_validation_cache, save_validation_cache
 
 # ==========================================
 # 1. 缺失的模板定义
 # ==========================================
 
+# 模板在加载时即去掉首尾空白，生成时 format 的结果可直接使用
+
 # FSM 使用 Enum list 解构 (这是失败案例的关键!)
 TEMPLATE_FSM_ENUM_LIST = """
 import chisel3._
 import chisel3.util._
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
     val toggle = Input(Bool())
     val state = Output(Bool())
-  })
+  }})
   
   // Define states using Enum list destructuring
   val sOff :: sOn :: Nil = Enum(2)
   val stateReg = RegInit(sOff)
   
   // State transition logic
-  switch (stateReg) {
-    is (sOff) {
-      when (io.toggle) {
+  switch (stateReg) {{
+    is (sOff) {{
+      when (io.toggle) {{
         stateReg := sOn
-      }
-    }
-    is (sOn) {
-      when (io.toggle) {
+      }}
+    }}
+    is (sOn) {{
+      when (io.toggle) {{
         stateReg := sOff
-      }
-    }
-  }
+      }}
+    }}
+  }}
   
   io.state := stateReg === sOn
-}
-"""
+}}
+""".strip()
 
 # 3 状态 FSM
 TEMPLATE_FSM_ENUM_3STATE = """
 import chisel3._
 import chisel3.util._
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
     val start = Input(Bool())
     val done = Input(Bool())
     val idle = Output(Bool())
     val busy = Output(Bool())
     val complete = Output(Bool())
-  })
+  }})
   
   // Define 3 states using Enum list destructuring
   val sIdle :: sBusy :: sDone :: Nil = Enum(3)
   val stateReg = RegInit(sIdle)
   
   // State transition logic
-  switch (stateReg) {
-    is (sIdle) {
-      when (io.start) {
+  switch (stateReg) {{
+    is (sIdle) {{
+      when (io.start) {{
         stateReg := sBusy
-      }
-    }
-    is (sBusy) {
-      when (io.done) {
+      }}
+    }}
+    is (sBusy) {{
+      when (io.done) {{
         stateReg := sDone
-      }
-    }
-    is (sDone) {
+      }}
+    }}
+    is (sDone) {{
       stateReg := sIdle
-    }
-  }
+    }}
+  }}
   
   io.idle := stateReg === sIdle
   io.busy := stateReg === sBusy
   io.complete := stateReg === sDone
-}
-"""
+}}
+""".strip()
 
 # 4 状态 FSM
 TEMPLATE_FSM_ENUM_4STATE = """
 import chisel3._
 import chisel3.util._
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
     val req = Input(Bool())
     val ack = Input(Bool())
     val state = Output(UInt(2.W))
-  })
+  }})
   
   // Define 4 states using Enum list destructuring
   val sIdle :: sRequest :: sWait :: sComplete :: Nil = Enum(4)
   val stateReg = RegInit(sIdle)
   
-  switch (stateReg) {
-    is (sIdle) {
-      when (io.req) { stateReg := sRequest }
-    }
-    is (sRequest) {
+  switch (stateReg) {{
+    is (sIdle) {{
+      when (io.req) {{ stateReg := sRequest }}
+    }}
+    is (sRequest) {{
       stateReg := sWait
-    }
-    is (sWait) {
-      when (io.ack) { stateReg := sComplete }
-    }
-    is (sComplete) {
+    }}
+    is (sWait) {{
+      when (io.ack) {{ stateReg := sComplete }}
+    }}
+    is (sComplete) {{
       stateReg := sIdle
-    }
-  }
+    }}
+  }}
   
   io.state := stateReg
-}
-"""
+}}
+""".strip()
+
+# 3 状态 FSM，ChiselEnum 显式独热编码 (状态对象以模块名为前缀，批量编译时互不冲突)
+TEMPLATE_FSM_CHISELENUM_ONEHOT = """
+import chisel3._
+import chisel3.util._
+
+object {module_name}State extends ChiselEnum {{
+  // One-hot encoding: each state owns exactly one bit
+  val sIdle = Value(1.U)
+  val sBusy = Value(2.U)
+  val sDone = Value(4.U)
+}}
+
+class {module_name} extends Module {{
+  import {module_name}State._
+  
+  val io = IO(new Bundle {{
+    val start = Input(Bool())
+    val done = Input(Bool())
+    val idle = Output(Bool())
+    val busy = Output(Bool())
+    val complete = Output(Bool())
+  }})
+  
+  val stateReg = RegInit(sIdle)
+  
+  // State transition logic
+  switch (stateReg) {{
+    is (sIdle) {{
+      when (io.start) {{
+        stateReg := sBusy
+      }}
+    }}
+    is (sBusy) {{
+      when (io.done) {{
+        stateReg := sDone
+      }}
+    }}
+    is (sDone) {{
+      stateReg := sIdle
+    }}
+  }}
+  
+  io.idle := stateReg === sIdle
+  io.busy := stateReg === sBusy
+  io.complete := stateReg === sDone
+}}
+""".strip()
 
 # PopCount - 计算置位位数
 TEMPLATE_POPCOUNT = """
 import chisel3._
 import chisel3.util.PopCount
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
-    val in = Input(UInt({{ width }}.W))
-    val count = Output(UInt({{ count_width }}.W))
-  })
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
+    val in = Input(UInt({width}.W))
+    val count = Output(UInt({count_width}.W))
+  }})
   
   // Count the number of set bits using PopCount
   io.count := PopCount(io.in)
-}
-"""
+}}
+""".strip()
 
 # Reverse - 位翻转
 TEMPLATE_REVERSE = """
 import chisel3._
 import chisel3.util.Reverse
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
-    val in = Input(UInt({{ width }}.W))
-    val out = Output(UInt({{ width }}.W))
-  })
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
+    val in = Input(UInt({width}.W))
+    val out = Output(UInt({width}.W))
+  }})
   
   // Reverse the bit order
   io.out := Reverse(io.in)
-}
-"""
+}}
+""".strip()
 
 # Fill - 位复制
 TEMPLATE_FILL = """
 import chisel3._
 import chisel3.util.Fill
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
-    val in = Input(UInt({{ width }}.W))
-    val out = Output(UInt({{ total_width }}.W))
-  })
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
+    val in = Input(UInt({width}.W))
+    val out = Output(UInt({total_width}.W))
+  }})
   
-  // Replicate the input {{ times }} times
-  io.out := Fill({{ times }}, io.in)
-}
-"""
+  // Replicate the input {times} times
+  io.out := Fill({times}, io.in)
+}}
+""".strip()
 
 # Log2 - 对数计算
 TEMPLATE_LOG2 = """
 import chisel3._
 import chisel3.util.Log2
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
-    val in = Input(UInt({{ width }}.W))
-    val out = Output(UInt({{ log_width }}.W))
-  })
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
+    val in = Input(UInt({width}.W))
+    val out = Output(UInt({log_width}.W))
+  }})
   
   // Calculate floor(log2(in))
   io.out := Log2(io.in)
-}
-"""
+}}
+""".strip()
 
 # PriorityEncoder - 优先级编码器
 TEMPLATE_PRIORITY_ENCODER = """
 import chisel3._
 import chisel3.util.PriorityEncoder
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
-    val in = Input(UInt({{ width }}.W))
-    val out = Output(UInt({{ enc_width }}.W))
-  })
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
+    val in = Input(UInt({width}.W))
+    val out = Output(UInt({enc_width}.W))
+  }})
   
   // Find position of least significant set bit
   io.out := PriorityEncoder(io.in)
-}
-"""
+}}
+""".strip()
 
 # OHToUInt - 独热码转二进制
 TEMPLATE_OH_TO_UINT = """
 import chisel3._
 import chisel3.util.OHToUInt
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
-    val oneHot = Input(UInt({{ width }}.W))
-    val binary = Output(UInt({{ enc_width }}.W))
-  })
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
+    val oneHot = Input(UInt({width}.W))
+    val binary = Output(UInt({enc_width}.W))
+  }})
   
   // Convert one-hot encoding to binary
   io.binary := OHToUInt(io.oneHot)
-}
-"""
+}}
+""".strip()
 
 # UIntToOH - 二进制转独热码
 TEMPLATE_UINT_TO_OH = """
 import chisel3._
 import chisel3.util.UIntToOH
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
-    val binary = Input(UInt({{ enc_width }}.W))
-    val oneHot = Output(UInt({{ width }}.W))
-  })
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
+    val binary = Input(UInt({enc_width}.W))
+    val oneHot = Output(UInt({width}.W))
+  }})
   
   // Convert binary to one-hot encoding
   io.oneHot := UIntToOH(io.binary)
-}
-"""
+}}
+""".strip()
 
 # Mux1H - 独热码选择器
 TEMPLATE_MUX1H = """
 import chisel3._
 import chisel3.util.Mux1H
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
     val sel = Input(UInt(4.W))
-    val in0 = Input(UInt({{ width }}.W))
-    val in1 = Input(UInt({{ width }}.W))
-    val in2 = Input(UInt({{ width }}.W))
-    val in3 = Input(UInt({{ width }}.W))
-    val out = Output(UInt({{ width }}.W))
-  })
+    val in0 = Input(UInt({width}.W))
+    val in1 = Input(UInt({width}.W))
+    val in2 = Input(UInt({width}.W))
+    val in3 = Input(UInt({width}.W))
+    val out = Output(UInt({width}.W))
+  }})
   
   // One-hot multiplexer
   io.out := Mux1H(Seq(
@@ -271,28 +323,28 @@ class {{ module_name }} extends Module {
     io.sel(2) -> io.in2,
     io.sel(3) -> io.in3
   ))
-}
-"""
+}}
+""".strip()
 
 # 移位寄存器使用 Cat (确保模型学会 import)
 TEMPLATE_SHIFT_REG_CAT = """
 import chisel3._
 import chisel3.util.Cat
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
     val in = Input(Bool())
-    val out = Output(UInt({{ depth }}.W))
-  })
+    val out = Output(UInt({depth}.W))
+  }})
   
-  val shiftReg = RegInit(0.U({{ depth }}.W))
+  val shiftReg = RegInit(0.U({depth}.W))
   
   // Shift using Cat: concatenate new bit with existing bits
-  shiftReg := Cat(shiftReg({{ depth_minus_2 }}:0), io.in)
+  shiftReg := Cat(shiftReg({depth_minus_2}:0), io.in)
   
   io.out := shiftReg
-}
-"""
+}}
+""".strip()
 
 # ==========================================
 # 2. 指令模板
@@ -320,6 +372,13 @@ INSTRUCTIONS = {
         "Write a 4-state controller using Enum list destructuring.",
         "Build a multi-stage FSM with request and acknowledge signals.",
     ],
+    "fsm_chiselenum_onehot": [
+        "Create a 3-state FSM (Idle, Busy, Done) using ChiselEnum with one-hot encoding.",
+        "Implement a one-hot encoded state machine with idle, busy, and done states.",
+        "Design a task controller FSM whose ChiselEnum states use one-hot values.",
+        "Write a 3-state workflow FSM with explicit one-hot ChiselEnum encoding.",
+        "Build an FSM using ChiselEnum with sparse state values 1, 2 and 4.",
+    ],
     "popcount": [
         "Count the number of set bits in a {width}-bit input.",
         "Implement a population count module for {width}-bit values.",
@@ -389,170 +448,200 @@ INSTRUCTIONS = {
 # 3. 生成函数
 # ==========================================
 
-def get_instruction(category, **kwargs):
+# 各生成器的随机取值池 (模块级元组，避免每次调用重新构建列表)
+_FSM_PREFIXES = ("Auto", "Smart", "Fast", "Quick", "Simple")
+_FSM2_NOUNS = ("ToggleFSM", "Flipper", "PingPong", "Alternator")
+_FSM3_NOUNS = ("TaskFSM", "WorkflowCtrl", "ProcessFSM", "StateMgr")
+_FSM4_NOUNS = ("HandshakeFSM", "ProtocolCtrl", "ReqAckFSM", "MultiStageFSM")
+_FSM_ONEHOT_NOUNS = ("OneHotFSM", "TaskCtrl", "HotStateFSM", "SparseFSM")
+_UTIL_PREFIXES = ("Util", "Bit", "Logic", "Fast")
+_POPCOUNT_NOUNS = ("PopCounter", "BitCounter", "OnesCount", "SetBitCount")
+_REVERSE_NOUNS = ("BitReverser", "Reverser", "BitFlip", "MirrorBits")
+_FILL_NOUNS = ("BitFill", "Replicator", "BitExpand", "Duplicator")
+_LOG2_NOUNS = ("Log2Calc", "BitPosition", "HighBitFinder", "Log2Unit")
+_PRIORITY_ENCODER_NOUNS = ("PriorityEnc", "LowBitFinder", "PrioEncoder", "FirstOne")
+_OH_TO_UINT_NOUNS = ("OHDecoder", "OneHotToBin", "OHConverter", "OneHotDec")
+_UINT_TO_OH_NOUNS = ("OHEncoder", "BinToOneHot", "OHGenerator", "OneHotEnc")
+_MUX1H_NOUNS = ("Mux1H", "OneHotMux", "OHSelector", "OneHotSwitch")
+_SHIFT_PREFIXES = ("Cycle", "Data", "Sync", "Fast")
+_SHIFT_CAT_NOUNS = ("ShiftPipe", "CatShift", "BitShifter", "ConcatReg")
+
+# 各模板的参数取值范围 (生成器随机抽取；golden_shapes() 据此枚举全部结构)
+_POPCOUNT_WIDTHS = (4, 8, 16, 32)
+_REVERSE_WIDTHS = (4, 8, 16, 32)
+_FILL_WIDTHS = (4, 8, 16)
+_FILL_TIMES = (2, 4, 8)
+_LOG2_WIDTHS = (8, 16, 32)
+_PRIORITY_ENCODER_WIDTHS = (4, 8, 16)
+_OH_TO_UINT_WIDTHS = (4, 8, 16)
+_UINT_TO_OH_WIDTHS = (4, 8, 16)
+_MUX1H_WIDTHS = (8, 16, 32)
+_SHIFT_CAT_DEPTHS = (4, 8, 16)
+
+# 位宽派生量查表: ceil(log2(w)) 与 PopCount 结果位宽 (宽度只取自上面几个固定值)
+_CLOG2 = {w: (w - 1).bit_length() for w in (4, 8, 16, 32)}
+_COUNT_WIDTH = {w: _CLOG2[w] + 1 for w in _POPCOUNT_WIDTHS}
+
+def get_instruction(category, rng, **kwargs):
     """获取随机指令"""
-    template = random.choice(INSTRUCTIONS[category])
+    template = rng.choice(INSTRUCTIONS[category])
     return template.format(**kwargs)
 
-def generate_fsm_enum(index):
+def generate_fsm_enum(index, rng):
     """生成 Enum FSM 样本"""
-    variant = random.choice(["2state", "3state", "4state"])
-    prefixes = ["Auto", "Smart", "Fast", "Quick", "Simple"]
+    variant = rng.choice(("2state", "3state", "4state", "onehot"))
     
     if variant == "2state":
-        nouns = ["ToggleFSM", "Flipper", "PingPong", "Alternator"]
-        module_name = f"{random.choice(prefixes)}{random.choice(nouns)}_{index}"
-        t = Template(TEMPLATE_FSM_ENUM_LIST)
-        code = t.render(module_name=module_name).strip()
-        instruction = get_instruction("fsm_enum_2state")
+        module_name = f"{rng.choice(_FSM_PREFIXES)}{rng.choice(_FSM2_NOUNS)}_{index}"
+        code = TEMPLATE_FSM_ENUM_LIST.format(module_name=module_name)
+        instruction = get_instruction("fsm_enum_2state", rng)
     elif variant == "3state":
-        nouns = ["TaskFSM", "WorkflowCtrl", "ProcessFSM", "StateMgr"]
-        module_name = f"{random.choice(prefixes)}{random.choice(nouns)}_{index}"
-        t = Template(TEMPLATE_FSM_ENUM_3STATE)
-        code = t.render(module_name=module_name).strip()
-        instruction = get_instruction("fsm_enum_3state")
-    else:  # 4state
-        nouns = ["HandshakeFSM", "ProtocolCtrl", "ReqAckFSM", "MultiStageFSM"]
-        module_name = f"{random.choice(prefixes)}{random.choice(nouns)}_{index}"
-        t = Template(TEMPLATE_FSM_ENUM_4STATE)
-        code = t.render(module_name=module_name).strip()
-        instruction = get_instruction("fsm_enum_4state")
+        module_name = f"{rng.choice(_FSM_PREFIXES)}{rng.choice(_FSM3_NOUNS)}_{index}"
+        code = TEMPLATE_FSM_ENUM_3STATE.format(module_name=module_name)
+        instruction = get_instruction("fsm_enum_3state", rng)
+    elif variant == "4state":
+        module_name = f"{rng.choice(_FSM_PREFIXES)}{rng.choice(_FSM4_NOUNS)}_{index}"
+        code = TEMPLATE_FSM_ENUM_4STATE.format(module_name=module_name)
+        instruction = get_instruction("fsm_enum_4state", rng)
+    else:  # onehot (ChiselEnum)
+        module_name = f"{rng.choice(_FSM_PREFIXES)}{rng.choice(_FSM_ONEHOT_NOUNS)}_{index}"
+        code = TEMPLATE_FSM_CHISELENUM_ONEHOT.format(module_name=module_name)
+        instruction = get_instruction("fsm_chiselenum_onehot", rng)
     
     return module_name, instruction, code
 
-def generate_popcount(index):
+def generate_popcount(index, rng):
     """生成 PopCount 样本"""
-    width = random.choice([4, 8, 16, 32])
-    count_width = (width - 1).bit_length() + 1
-    
-    prefixes = ["Util", "Bit", "Logic", "Fast"]
-    nouns = ["PopCounter", "BitCounter", "OnesCount", "SetBitCount"]
-    module_name = f"{random.choice(prefixes)}{random.choice(nouns)}_{index}"
+    width = rng.choice(_POPCOUNT_WIDTHS)
+    count_width = _COUNT_WIDTH[width]
+    module_name = f"{rng.choice(_UTIL_PREFIXES)}{rng.choice(_POPCOUNT_NOUNS)}_{index}"
     
-    t = Template(TEMPLATE_POPCOUNT)
-    code = t.render(module_name=module_name, width=width, count_width=count_width).strip()
-    instruction = get_instruction("popcount", width=width)
+    code = TEMPLATE_POPCOUNT.format(module_name=module_name, width=width, count_width=count_width)
+    instruction = get_instruction("popcount", rng, width=width)
     
     return module_name, instruction, code
 
-def generate_reverse(index):
+def generate_reverse(index, rng):
     """生成 Reverse 样本"""
-    width = random.choice([4, 8, 16, 32])
+    width = rng.choice(_REVERSE_WIDTHS)
+    module_name = f"{rng.choice(_UTIL_PREFIXES)}{rng.choice(_REVERSE_NOUNS)}_{index}"
     
-    prefixes = ["Util", "Bit", "Logic", "Fast"]
-    nouns = ["BitReverser", "Reverser", "BitFlip", "MirrorBits"]
-    module_name = f"{random.choice(prefixes)}{random.choice(nouns)}_{index}"
-    
-    t = Template(TEMPLATE_REVERSE)
-    code = t.render(module_name=module_name, width=width).strip()
-    instruction = get_instruction("reverse", width=width)
+    code = TEMPLATE_REVERSE.format(module_name=module_name, width=width)
+    instruction = get_instruction("reverse", rng, width=width)
     
     return module_name, instruction, code
 
-def generate_fill(index):
+def generate_fill(index, rng):
     """生成 Fill 样本"""
-    width = random.choice([4, 8, 16])
-    times = random.choice([2, 4, 8])
+    width = rng.choice(_FILL_WIDTHS)
+    times = rng.choice(_FILL_TIMES)
     total_width = width * times
+    module_name = f"{rng.choice(_UTIL_PREFIXES)}{rng.choice(_FILL_NOUNS)}_{index}"
     
-    prefixes = ["Util", "Bit", "Logic", "Fast"]
-    nouns = ["BitFill", "Replicator", "BitExpand", "Duplicator"]
-    module_name = f"{random.choice(prefixes)}{random.choice(nouns)}_{index}"
-    
-    t = Template(TEMPLATE_FILL)
-    code = t.render(module_name=module_name, width=width, times=times, total_width=total_width).strip()
-    instruction = get_instruction("fill", width=width, times=times)
+    code = TEMPLATE_FILL.format(module_name=module_name, width=width, times=times, total_width=total_width)
+    instruction = get_instruction("fill", rng, width=width, times=times)
     
     return module_name, instruction, code
 
-def generate_log2(index):
+def generate_log2(index, rng):
     """生成 Log2 样本"""
-    width = random.choice([8, 16, 32])
-    log_width = (width - 1).bit_length()
-    
-    prefixes = ["Util", "Bit", "Logic", "Fast"]
-    nouns = ["Log2Calc", "BitPosition", "HighBitFinder", "Log2Unit"]
-    module_name = f"{random.choice(prefixes)}{random.choice(nouns)}_{index}"
+    width = rng.choice(_LOG2_WIDTHS)
+    log_width = _CLOG2[width]
+    module_name = f"{rng.choice(_UTIL_PREFIXES)}{rng.choice(_LOG2_NOUNS)}_{index}"
     
-    t = Template(TEMPLATE_LOG2)
-    code = t.render(module_name=module_name, width=width, log_width=log_width).strip()
-    instruction = get_instruction("log2", width=width)
+    code = TEMPLATE_LOG2.format(module_name=module_name, width=width, log_width=log_width)
+    instruction = get_instruction("log2", rng, width=width)
     
     return module_name, instruction, code
 
-def generate_priority_encoder(index):
+def generate_priority_encoder(index, rng):
     """生成 PriorityEncoder 样本"""
-    width = random.choice([4, 8, 16])
-    enc_width = (width - 1).bit_length()
+    width = rng.choice(_PRIORITY_ENCODER_WIDTHS)
+    enc_width = _CLOG2[width]
+    module_name = f"{rng.choice(_UTIL_PREFIXES)}{rng.choice(_PRIORITY_ENCODER_NOUNS)}_{index}"
     
-    prefixes = ["Util", "Bit", "Logic", "Fast"]
-    nouns = ["PriorityEnc", "LowBitFinder", "PrioEncoder", "FirstOne"]
-    module_name = f"{random.choice(prefixes)}{random.choice(nouns)}_{index}"
-    
-    t = Template(TEMPLATE_PRIORITY_ENCODER)
-    code = t.render(module_name=module_name, width=width, enc_width=enc_width).strip()
-    instruction = get_instruction("priority_encoder", width=width)
+    code = TEMPLATE_PRIORITY_ENCODER.format(module_name=module_name, width=width, enc_width=enc_width)
+    instruction = get_instruction("priority_encoder", rng, width=width)
     
     return module_name, instruction, code
 
-def generate_oh_to_uint(index):
+def generate_oh_to_uint(index, rng):
     """生成 OHToUInt 样本"""
-    width = random.choice([4, 8, 16])
-    enc_width = (width - 1).bit_length()
-    
-    prefixes = ["Util", "Bit", "Logic", "Fast"]
-    nouns = ["OHDecoder", "OneHotToBin", "OHConverter", "OneHotDec"]
-    module_name = f"{random.choice(prefixes)}{random.choice(nouns)}_{index}"
+    width = rng.choice(_OH_TO_UINT_WIDTHS)
+    enc_width = _CLOG2[width]
+    module_name = f"{rng.choice(_UTIL_PREFIXES)}{rng.choice(_OH_TO_UINT_NOUNS)}_{index}"
     
-    t = Template(TEMPLATE_OH_TO_UINT)
-    code = t.render(module_name=module_name, width=width, enc_width=enc_width).strip()
-    instruction = get_instruction("oh_to_uint", width=width)
+    code = TEMPLATE_OH_TO_UINT.format(module_name=module_name, width=width, enc_width=enc_width)
+    instruction = get_instruction("oh_to_uint", rng, width=width)
     
     return module_name, instruction, code
 
-def generate_uint_to_oh(index):
+def generate_uint_to_oh(index, rng):
     """生成 UIntToOH 样本"""
-    width = random.choice([4, 8, 16])
-    enc_width = (width - 1).bit_length()
+    width = rng.choice(_UINT_TO_OH_WIDTHS)
+    enc_width = _CLOG2[width]
+    module_name = f"{rng.choice(_UTIL_PREFIXES)}{rng.choice(_UINT_TO_OH_NOUNS)}_{index}"
     
-    prefixes = ["Util", "Bit", "Logic", "Fast"]
-    nouns = ["OHEncoder", "BinToOneHot", "OHGenerator", "OneHotEnc"]
-    module_name = f"{random.choice(prefixes)}{random.choice(nouns)}_{index}"
-    
-    t = Template(TEMPLATE_UINT_TO_OH)
-    code = t.render(module_name=module_name, width=width, enc_width=enc_width).strip()
-    instruction = get_instruction("uint_to_oh", width=width)
+    code = TEMPLATE_UINT_TO_OH.format(module_name=module_name, width=width, enc_width=enc_width)
+    instruction = get_instruction("uint_to_oh", rng, width=width)
     
     return module_name, instruction, code
 
-def generate_mux1h(index):
+def generate_mux1h(index, rng):
     """生成 Mux1H 样本"""
-    width = random.choice([8, 16, 32])
-    
-    prefixes = ["Util", "Bit", "Logic", "Fast"]
-    nouns = ["Mux1H", "OneHotMux", "OHSelector", "OneHotSwitch"]
-    module_name = f"{random.choice(prefixes)}{random.choice(nouns)}_{index}"
+    width = rng.choice(_MUX1H_WIDTHS)
+    module_name = f"{rng.choice(_UTIL_PREFIXES)}{rng.choice(_MUX1H_NOUNS)}_{index}"
     
-    t = Template(TEMPLATE_MUX1H)
-    code = t.render(module_name=module_name, width=width).strip()
-    instruction = get_instruction("mux1h", width=width)
+    code = TEMPLATE_MUX1H.format(module_name=module_name, width=width)
+    instruction = get_instruction("mux1h", rng, width=width)
     
     return module_name, instruction, code
 
-def generate_shift_cat(index):
+def generate_shift_cat(index, rng):
     """生成使用 Cat 的移位寄存器样本"""
-    depth = random.choice([4, 8, 16])
+    depth = rng.choice(_SHIFT_CAT_DEPTHS)
+    module_name = f"{rng.choice(_SHIFT_PREFIXES)}{rng.choice(_SHIFT_CAT_NOUNS)}_{index}"
     
-    prefixes = ["Cycle", "Data", "Sync", "Fast"]
-    nouns = ["ShiftPipe", "CatShift", "BitShifter", "ConcatReg"]
-    module_name = f"{random.choice(prefixes)}{random.choice(nouns)}_{index}"
-    
-    t = Template(TEMPLATE_SHIFT_REG_CAT)
-    code = t.render(module_name=module_name, depth=depth, depth_minus_2=depth-2).strip()
-    instruction = get_instruction("shift_cat", depth=depth)
+    code = TEMPLATE_SHIFT_REG_CAT.format(module_name=module_name, depth=depth, depth_minus_2=depth-2)
+    instruction = get_instruction("shift_cat", rng, depth=depth)
     
     return module_name, instruction, code
 
+def golden_shapes():
+    """
+    枚举所有模板在参数取值范围内的全部结构 (模块名固定为占位名)。
+    
+    模块名不影响可编译性，启动时把这些结构各验证一次 (golden 验证)，
+    之后生成的样本只需按结构指纹查表，不必再逐个调用 reflect。
+    
+    Returns:
+        list: [(module_name, code), ...]
+    """
+    renders = [
+        (TEMPLATE_FSM_ENUM_LIST, {}),
+        (TEMPLATE_FSM_ENUM_3STATE, {}),
+        (TEMPLATE_FSM_ENUM_4STATE, {}),
+        (TEMPLATE_FSM_CHISELENUM_ONEHOT, {}),
+    ]
+    renders += [(TEMPLATE_POPCOUNT, dict(width=w, count_width=_COUNT_WIDTH[w])) for w in _POPCOUNT_WIDTHS]
+    renders += [(TEMPLATE_REVERSE, dict(width=w)) for w in _REVERSE_WIDTHS]
+    renders += [
+        (TEMPLATE_FILL, dict(width=w, times=t, total_width=w * t))
+        for w in _FILL_WIDTHS for t in _FILL_TIMES
+    ]
+    renders += [(TEMPLATE_LOG2, dict(width=w, log_width=_CLOG2[w])) for w in _LOG2_WIDTHS]
+    renders += [(TEMPLATE_PRIORITY_ENCODER, dict(width=w, enc_width=_CLOG2[w])) for w in _PRIORITY_ENCODER_WIDTHS]
+    renders += [(TEMPLATE_OH_TO_UINT, dict(width=w, enc_width=_CLOG2[w])) for w in _OH_TO_UINT_WIDTHS]
+    renders += [(TEMPLATE_UINT_TO_OH, dict(width=w, enc_width=_CLOG2[w])) for w in _UINT_TO_OH_WIDTHS]
+    renders += [(TEMPLATE_MUX1H, dict(width=w)) for w in _MUX1H_WIDTHS]
+    renders += [(TEMPLATE_SHIFT_REG_CAT, dict(depth=d, depth_minus_2=d - 2)) for d in _SHIFT_CAT_DEPTHS]
+    
+    shapes = []
+    for i, (template, params) in enumerate(renders):
+        module_name = f"GoldenShape_{i}"
+        shapes.append((module_name, template.format(module_name=module_name, **params)))
+    return shapes
+
 # ==========================================
 # 4. 验证与多进程生成
 # ==========================================
@@ -571,58 +660,57 @@ GENERATORS = [
     ("shift_cat", generate_shift_cat, 50),    # Cat 移位 - 额外强化
 ]
 
-def validate_code(code, module_name):
-    """验证代码"""
-    try:
-        result = reflect(
-            chisel_code_string=code,
-            module_name=module_name,
-            testbench_path=None,
-            output_dir=None,
-            verilog_file=None,
-            result_file=None,
-            silent=True
-        )
-        return result['compiled'] and result['elaborated']
-    except Exception as e:
-        return False
+# 生成器函数表: 任务和统计中的类型都用 GENERATORS 中的下标表示
+GEN_FUNCS = tuple(fn for _, fn, _ in GENERATORS)
 
-def worker_task(args):
-    """多进程工作函数"""
-    index, seed, gen_type = args
-    random.seed(seed)
-    
-    # 根据类型选择生成器
-    gen_map = {
-        "fsm_enum": generate_fsm_enum,
-        "popcount": generate_popcount,
-        "reverse": generate_reverse,
-        "fill": generate_fill,
-        "log2": generate_log2,
-        "priority_encoder": generate_priority_encoder,
-        "oh_to_uint": generate_oh_to_uint,
-        "uint_to_oh": generate_uint_to_oh,
-        "mux1h": generate_mux1h,
-        "shift_cat": generate_shift_cat,
-    }
-    
-    gen_func = gen_map.get(gen_type)
-    if not gen_func:
-        return None
-    
+# 未达标类型的最大补齐轮数 (防止某个模板持续验证失败时无限循环)
+MAX_ROUNDS = 5
+
+# 每次 reflect_batch 验证的候选数 (一次 Mill/JVM 调用编译阐述一整批)
+VALIDATE_BATCH_SIZE = 16
+
+# 每写入多少条样本刷新一次输出文件
+FLUSH_EVERY = 50
+
+# 每个 worker 进程独占的 Mill 工作区 (由 init_worker 创建)
+_WORKSPACE = None
+
+def init_worker(workspace_root):
+    """进程池初始化: 为当前 worker 创建持久工作区，之后各批次复用同一个 Mill server (JVM)"""
+    global _WORKSPACE
+    _WORKSPACE = tempfile.mkdtemp(prefix="worker_", dir=workspace_root)
+
+def cheap_check(code, module_name):
+    """
+    进入 JVM 之前的廉价预检: 导入语句、类定义、括号配对。
+    不通过的候选必然编译失败，直接丢弃，不浪费一次阐述。
+    """
+    if "import chisel3._" not in code or f"class {module_name} " not in code:
+        return False
+    depth = {"(": 0, "{": 0, "[": 0}
+    closing = {")": "(", "}": "{", "]": "["}
+    for ch in code:
+        if ch in depth:
+            depth[ch] += 1
+        elif ch in closing:
+            depth[closing[ch]] -= 1
+            if depth[closing[ch]] < 0:
+                return False
+    return not any(depth.values())
+
+def verify_shapes(shapes):
+    """
+    多进程工作函数: 用一次 reflect_batch 验证一批结构，返回 [(结构指纹, 是否通过), ...]。
+    只返回确定的结论，结论未知 (Mill 超时等) 的结构不返回，留待下一轮重新验证
+    """
     try:
-        module_name, instruction, code = gen_func(index)
-        
-        if validate_code(code, module_name):
-            return {
-                "instruction": instruction,
-                "input": "",
-                "output": code,
-                "type": gen_type
-            }
-        return None
-    except Exception as e:
-        return None
+        passed = reflect_batch(shapes, silent=True, workspace_dir=_WORKSPACE)
+    except Exception:
+        return []
+    return [
+        (shape_key(code, module_name), ok)
+        for (module_name, code), ok in zip(shapes, passed) if ok is not None
+    ]
 
 def main():
     print("=" * 60)
@@ -634,7 +722,7 @@ def main():
     print(f"📊 总目标样本数: {total_target}")
     
     # 自动检测 CPU 核心数，但限制最大值避免内存压力
-    num_processes = min(multiprocessing.cpu_count(), 4)
+    num_processes = min(available_cpus(), 4)
     if len(sys.argv) > 1:
         try:
             num_processes = int(sys.argv[1])
@@ -645,72 +733,135 @@ def main():
     print("⏳ JVM 预热中，请稍候...")
     
     # 统计各类型已生成数量
-    type_counts = {name: 0 for name, _, _ in GENERATORS}
-    type_targets = {name: count for name, _, count in GENERATORS}
-    
-    all_samples = []
+    gen_names = [name for name, _, _ in GENERATORS]
+    type_counts = [0] * len(GENERATORS)
+    type_targets = [count for _, _, count in GENERATORS]
     
     # 实时保存文件（防止意外中断丢失数据）
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     output_file = f"dataset/chisel_util_supplement_{timestamp}.jsonl"
-    output_handle = open(output_file, 'w', encoding='utf-8')
+    output_handle = open(output_file, 'wb')
     
     # 创建进程池
     print(f"🔧 创建进程池 (workers={num_processes})...")
-    pool = multiprocessing.Pool(processes=num_processes)
+    workspace_root = tempfile.mkdtemp(prefix="chisel_ws_")
+    pool = multiprocessing.Pool(
+        processes=num_processes,
+        initializer=init_worker,
+        initargs=(workspace_root,)
+    )
+    
+    # 结构验证结论只在主进程维护: 样本在主进程生成，只有未知结构才交给 worker 验证。
+    # shape_cache 还包含本次运行内预检 (cheap_check) 得出的否定结论，只有 new_shapes 中
+    # 经 JVM 实际验证的结论才写回持久化缓存
+    shape_cache = load_validation_cache()
+    new_shapes = {}
+    if shape_cache:
+        print(f"💾 已加载 {len(shape_cache)} 条历史验证结论")
     
     # 使用 tqdm 显示进度
     pbar = tqdm(total=total_target, desc="生成进度", dynamic_ncols=True)
     
     try:
+        # Golden 验证: 启动时把所有模板结构各验证一次，预先填充结构缓存
+        # (已有历史结论的结构直接跳过)
+        shapes = [
+            (module_name, code) for module_name, code in golden_shapes()
+            if shape_key(code, module_name) not in shape_cache
+        ]
+        if shapes:
+            pbar.write(f"🥇 Golden 验证 {len(shapes)} 种模板结构...")
+            shape_chunks = [shapes[i::num_processes] for i in range(num_processes)]
+            for verdicts in pool.imap_unordered(verify_shapes, shape_chunks):
+                shape_cache.update(verdicts)
+                new_shapes.update(verdicts)
+            save_validation_cache(new_shapes)
+        
         base_seed = random.randint(0, 100000)
         task_index = 0
-        pending_results = []
+        total_done = 0
         
-        # 逐类型生成，每个类型完成后立即处理
-        for gen_name, _, target_count in GENERATORS:
-            current_count = 0
-            batch_size = min(target_count + 20, 100)  # 每批次任务数
+        # 按轮次补齐: 每轮只为未达标的类型生成候选。样本生成 (纯 Python、很快) 在主进程完成，
+        # 已知结构直接查表，只有未知结构的代表才分批交给 worker 做 JVM 验证
+        for round_num in range(1, MAX_ROUNDS + 1):
+            tasks_by_type = []
+            for gen_type, target_count in enumerate(type_targets):
+                missing = target_count - type_counts[gen_type]
+                if missing <= 0:
+                    continue
+                # 20% 冗余抵消验证失败
+                count = missing + max(5, missing // 5)
+                tasks_by_type.append([
+                    (i, base_seed + i, gen_type) for i in range(task_index, task_index + count)
+                ])
+                task_index += count
+            
+            if not tasks_by_type:
+                break
             
-            while current_count < target_count:
-                # 创建一批任务
-                batch_tasks = []
-                for _ in range(batch_size):
-                    batch_tasks.append((task_index, base_seed + task_index, gen_name))
-                    task_index += 1
+            # 各类型轮流交错排列，输出样本中各类型均匀混合
+            tasks = [
+                task for group in itertools.zip_longest(*tasks_by_type)
+                for task in group if task is not None
+            ]
+            
+            ready = []    # 结构已验证通过的样本 (gen_type, instruction, code)
+            pending = {}  # 未知结构: 结构指纹 -> [(gen_type, module_name, instruction, code), ...]
+            for index, seed, gen_type in tasks:
+                # 每个任务独立的随机数生成器，不触碰进程全局的 random 状态
+                rng = random.Random(seed)
+                try:
+                    module_name, instruction, code = GEN_FUNCS[gen_type](index, rng)
+                except Exception:
+                    continue
                 
-                # 使用 apply_async 提交任务，设置超时
-                async_results = [pool.apply_async(worker_task, (task,)) for task in batch_tasks]
+                key = shape_key(code, module_name)
+                verdict = shape_cache.get(key)
+                if verdict is None and not cheap_check(code, module_name):
+                    # 预检是启发式的，结论只在本次运行内复用，不持久化
+                    verdict = shape_cache[key] = False
+                if verdict is None:
+                    pending.setdefault(key, []).append((gen_type, module_name, instruction, code))
+                elif verdict:
+                    ready.append((gen_type, instruction, code))
+            
+            if pending:
+                # 每种未知结构只取一个代表验证，结论适用于同结构的全部样本
+                reps = [(group[0][1], group[0][3]) for group in pending.values()]
+                batches = [reps[i:i + VALIDATE_BATCH_SIZE] for i in range(0, len(reps), VALIDATE_BATCH_SIZE)]
+                # 每个 worker 约分到 8 次派发，批次很多时合并派发以减少 IPC 往返
+                chunksize = max(1, len(batches) // (num_processes * 8))
+                for verdicts in pool.imap_unordered(verify_shapes, batches, chunksize=chunksize):
+                    shape_cache.update(verdicts)
+                    new_shapes.update(verdicts)
+                for key, group in pending.items():
+                    if shape_cache.get(key):
+                        ready.extend((gen_type, instruction, code) for gen_type, _, instruction, code in group)
+            
+            for gen_type, instruction, code in ready:
+                if type_counts[gen_type] >= type_targets[gen_type]:
+                    continue  # 该类型已达标，丢弃多余样本
                 
-                # 收集结果，每个任务最多等待 60 秒
-                for ar in async_results:
-                    try:
-                        result = ar.get(timeout=60)
-                        if result is not None and current_count < target_count:
-                            gen_type = result.pop("type")
-                            current_count += 1
-                            type_counts[gen_type] = current_count
-                            all_samples.append(result)
-                            
-                            # 实时写入文件
-                            output_handle.write(json.dumps(result, ensure_ascii=False) + '\n')
-                            output_handle.flush()
-                            
-                            pbar.update(1)
-                            done = sum(type_counts.values())
-                            pbar.set_postfix({"type": gen_name, "done": f"{current_count}/{target_count}"})
-                            
-                            if current_count >= target_count:
-                                break
-                    except multiprocessing.TimeoutError:
-                        pass  # 超时跳过
-                    except Exception as e:
-                        pass  # 其他错误跳过
+                result = {
+                    "instruction": instruction,
+                    "input": "",
+                    "output": code
+                }
+                type_counts[gen_type] += 1
+                total_done += 1
                 
-                if current_count >= target_count:
-                    break
-            
-            print(f"  ✅ {gen_name}: {current_count}/{target_count} 完成")
+                # 实时写入文件 (样本不在内存中累积，定期刷新保证中断时已写入的数据不丢)
+                output_handle.write(dumps_line(result))
+                if total_done % FLUSH_EVERY == 0:
+                    output_handle.flush()
+                
+                pbar.update(1)
+                pbar.set_postfix({"type": gen_names[gen_type], "done": f"{type_counts[gen_type]}/{type_targets[gen_type]}"})
+        
+        for gen_type, gen_name in enumerate(gen_names):
+            print(f"  ✅ {gen_name}: {type_counts[gen_type]}/{type_targets[gen_type]} 完成")
+        print(f"🧩 结构去重: 共 {len(shape_cache)} 种结构的验证结论")
+        save_validation_cache(new_shapes)
                 
     except KeyboardInterrupt:
         print("\n⚠️ 用户中断，保存已生成的数据...")
@@ -719,16 +870,20 @@ def main():
         output_handle.close()
         pool.terminate()
         pool.join()
+        # 关闭各 worker 工作区的 Mill server 并清理目录
+        for name in os.listdir(workspace_root):
+            close_workspace(os.path.join(workspace_root, name))
+        shutil.rmtree(workspace_root, ignore_errors=True)
     
     print(f"\n" + "=" * 60)
     print(f"✅ 补充数据集已保存: {output_file}")
-    print(f"📦 总样本数: {len(all_samples)}")
+    print(f"📦 总样本数: {sum(type_counts)}")
     print("=" * 60)
     
     # 统计各类型
     print("\n📊 各类型生成统计:")
-    for gen_name, _, target in GENERATORS:
-        actual = type_counts[gen_name]
+    for gen_type, (gen_name, _, target) in enumerate(GENERATORS):
+        actual = type_counts[gen_type]
         status = "✅" if actual >= target else "⚠️"
         print(f"  {status} {gen_name}: {actual}/{target}")
     
@@ -1,10 +1,19 @@
 import random
-import json
 import os
 import sys
 import multiprocessing
+import multiprocessing.util
+import queue
+import argparse
+import gc
+import itertools
+import shutil
+import tempfile
+import threading
+import time
+import psutil
+from collections import Counter
 from contextlib import redirect_stdout, redirect_stderr
-from jinja2 import Template
 from tqdm import tqdm
 from datetime import datetime
 
@@ -18,18 +27,23 @@ src_dir = os.path.join(parent_dir, 'src')
 sys.path.insert(0, src_dir)
 
 try:
-    from reflect_env import reflect
+    from reflect_env import close_workspace, reflect_batch
     print(f"✅ 成功导入 reflect_env (路径: {src_dir})")
 except ImportError:
     print(f"❌ 错误: 无法导入 reflect_env。请确保 src/reflect_env.py 存在。")
     sys.exit(1)
 
+from gen_core import available_cpus, dumps_line, shape_key, load_validation_cache, save_validation_cache
+
 # ==========================================
 # 0.5 错误日志管理
 # ==========================================
 
 ERROR_LOG_FILE = None
 
+# worker 进程内的日志队列 (由 init_worker 设置)，日志记录统一交给主进程的日志线程写盘
+_LOG_QUEUE = None
+
 def init_error_log():
     """初始化错误日志文件"""
     global ERROR_LOG_FILE
@@ -38,17 +52,43 @@ def init_error_log():
     os.makedirs(log_dir, exist_ok=True)
     ERROR_LOG_FILE = os.path.join(log_dir, f"generation_errors_{timestamp}.log")
     
-def log_error(log_file, index, module_name, error_info):
-    """记录验证失败的样本信息"""
-    if log_file:  # 使用传入的参数，而非全局变量
-        try:
-            with open(log_file, "a", encoding="utf-8") as f:
-                f.write(f"\n{'='*60}\n")
-                f.write(f"Index: {index} | Module: {module_name}\n")
-                f.write(f"Time: {datetime.now().isoformat()}\n")
-                f.write(f"Error: {error_info}\n")
-        except:
-            pass
+def log_error(index, module_name, error_info):
+    """
+    记录验证失败的样本信息: 在 worker 内把整条记录拼成一段 UTF-8 bytes 放入日志队列，
+    不在 worker 里打开文件; 日志线程拿到后一次 write 即可
+    """
+    if _LOG_QUEUE is not None:
+        payload = (
+            f"\n{'='*60}\n"
+            f"Index: {index} | Module: {module_name}\n"
+            f"Time: {datetime.now().isoformat()}\n"
+            f"Error: {error_info}\n"
+        )
+        _LOG_QUEUE.put(payload.encode("utf-8"))
+
+# 日志线程轮询队列的间隔 (秒)，以及主进程收尾时等待它写完剩余日志的最长时间 (秒)
+LOG_POLL_INTERVAL = 0.5
+LOGGER_JOIN_TIMEOUT = 10
+
+def logger_loop(log_queue, log_file, stop):
+    """
+    日志线程: 整个运行期间只打开一次日志文件 (二进制追加)，从队列取出记录顺序写入，
+    stop 置位且队列已取空时退出。所有 worker 的记录经同一个写者落盘，不会互相穿插。
+    不用队列里的结束标记: worker 被 terminate 时可能正持有队列的写锁或只写了半条记录，
+    主进程放入的标记可能永远到不了
+    """
+    with open(log_file, "ab", buffering=1 << 16) as f:
+        while True:
+            try:
+                payload = log_queue.get(timeout=LOG_POLL_INTERVAL)
+            except queue.Empty:
+                if stop.is_set():
+                    break
+                continue
+            except Exception:
+                # worker 被 terminate 时可能留下写了一半的记录，此后的日志无法再读取
+                break
+            f.write(payload)
 
 # ==========================================
 # 1. 指令多样性池 (Instruction Pool)
@@ -211,16 +251,18 @@ INSTRUCTION_TEMPLATES = {
     ]
 }
 
-def get_random_instruction(template_key, **kwargs):
-    """从指令池中随机选择一个模板并填充参数"""
-    templates = INSTRUCTION_TEMPLATES.get(template_key, [])
+# 指令池冻结为元组: 只读共享，取值无需再经列表间接
+INSTRUCTION_TEMPLATES = {key: tuple(templates) for key, templates in INSTRUCTION_TEMPLATES.items()}
+
+def get_random_instruction(template_key, rng, **kwargs):
+    """从指令池中随机选择一个模板并填充参数 (rng 为样本自己的 random.Random)"""
+    templates = INSTRUCTION_TEMPLATES.get(template_key)
     if not templates:
         return ""
-    template = random.choice(templates)
-    return template.format(**kwargs)
+    return rng.choice(templates).format_map(kwargs)
 
 # ==========================================
-# 2. 定义 Jinja2 模板 (Templates)
+# 2. 定义代码模板 (Templates)
 # ==========================================
 
 # --- Level 1: 基础类型定义 (50%) ---
@@ -228,61 +270,57 @@ def get_random_instruction(template_key, **kwargs):
 TEMPLATE_BASIC_TYPE = """
 import chisel3._
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
-    val out = Output({{ type_class }}({% if type_class != 'Bool' %}{{ width }}.W{% endif %}))
-  })
-  // Task: Define a {{ type_class }} {{ kind }} named '{{ var_name }}'
-  val {{ var_name }} = {{ kind }}({{ type_class }}({% if type_class != 'Bool' %}{{ width }}.W{% endif %}))
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
+    val out = Output({data_type})
+  }})
+  // Task: Define a {type_class} {kind} named '{var_name}'
+  val {var_name} = {kind}({data_type})
   
-  {% if kind == "Reg" %}
-  {{ var_name }} := {% if type_class == 'Bool' %}false.B{% else %}0.U.asTypeOf({{ var_name }}){% endif %}
-  {% elif kind == "Wire" %}
-  {{ var_name }} := {% if type_class == 'Bool' %}false.B{% else %}0.U.asTypeOf({{ var_name }}){% endif %}
-  {% endif %}
+  {var_name} := {init_value}
 
-  io.out := {{ var_name }}
-}
+  io.out := {var_name}
+}}
 """
 
 TEMPLATE_VEC = """
 import chisel3._
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
-    val out = Output(Vec({{ size }}, {{ type_class }}({{ width }}.W)))
-  })
-  // Task: Define a Vec of {{ size }} {{ type_class }}s
-  val {{ var_name }} = Wire(Vec({{ size }}, {{ type_class }}({{ width }}.W)))
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
+    val out = Output(Vec({size}, {type_class}({width}.W)))
+  }})
+  // Task: Define a Vec of {size} {type_class}s
+  val {var_name} = Wire(Vec({size}, {type_class}({width}.W)))
   
-  for (i <- 0 until {{ size }}) {
-    {{ var_name }}(i) := 0.U.asTypeOf({{ type_class }}({{ width }}.W))
-  }
+  for (i <- 0 until {size}) {{
+    {var_name}(i) := 0.U.asTypeOf({type_class}({width}.W))
+  }}
 
-  io.out := {{ var_name }}
-}
+  io.out := {var_name}
+}}
 """
 
 TEMPLATE_BUNDLE = """
 import chisel3._
 
-// 添加 {{ suffix }} 确保全局唯一性
-class MyBundle_{{ index }}_{{ suffix }} extends Bundle {
-  val field1 = UInt({{ width }}.W)
+// 添加 {suffix} 确保全局唯一性
+class MyBundle_{index}_{suffix} extends Bundle {{
+  val field1 = UInt({width}.W)
   val field2 = Bool()
-}
+}}
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
-    val out = Output(new MyBundle_{{ index }}_{{ suffix }})
-  })
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
+    val out = Output(new MyBundle_{index}_{suffix})
+  }})
   
-  val {{ var_name }} = Wire(new MyBundle_{{ index }}_{{ suffix }})
-  {{ var_name }}.field1 := 123.U
-  {{ var_name }}.field2 := true.B
+  val {var_name} = Wire(new MyBundle_{index}_{suffix})
+  {var_name}.field1 := 123.U
+  {var_name}.field2 := true.B
   
-  io.out := {{ var_name }}
-}
+  io.out := {var_name}
+}}
 """
 
 # --- Level 2: 基础组合逻辑 (35%) ---
@@ -290,52 +328,52 @@ class {{ module_name }} extends Module {
 TEMPLATE_ARITHMETIC = """
 import chisel3._
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
-    val a = Input(UInt({{ width }}.W))
-    val b = Input(UInt({{ width }}.W))
-    val out = Output(UInt({{ width }}.W))
-  })
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
+    val a = Input(UInt({width}.W))
+    val b = Input(UInt({width}.W))
+    val out = Output(UInt({width}.W))
+  }})
   
-  // Logic: {{ op_name }}
-  io.out := io.a {{ op_symbol }} io.b
-}
+  // Logic: {op_name}
+  io.out := io.a {op_symbol} io.b
+}}
 """
 
 TEMPLATE_MUX = """
 import chisel3._
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
     val sel = Input(Bool())
-    val a = Input(UInt({{ width }}.W))
-    val b = Input(UInt({{ width }}.W))
-    val out = Output(UInt({{ width }}.W))
-  })
+    val a = Input(UInt({width}.W))
+    val b = Input(UInt({width}.W))
+    val out = Output(UInt({width}.W))
+  }})
   
   // Logic: 2-to-1 Mux
   io.out := Mux(io.sel, io.a, io.b)
-}
+}}
 """
 
 TEMPLATE_WHEN = """
 import chisel3._
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
     val cond = Input(Bool())
-    val a = Input(UInt({{ width }}.W))
-    val out = Output(UInt({{ width }}.W))
-  })
+    val a = Input(UInt({width}.W))
+    val out = Output(UInt({width}.W))
+  }})
   
   io.out := 0.U
   
-  when (io.cond) {
+  when (io.cond) {{
     io.out := io.a
-  } .otherwise {
+  }} .otherwise {{
     io.out := 0.U
-  }
-}
+  }}
+}}
 """
 
 # 新增: Cat (位拼接)
@@ -343,31 +381,31 @@ TEMPLATE_CAT = """
 import chisel3._
 import chisel3.util.Cat
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
-    val high = Input(UInt({{ width }}.W))
-    val low = Input(UInt({{ width }}.W))
-    val out = Output(UInt({{ total_width }}.W))
-  })
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
+    val high = Input(UInt({width}.W))
+    val low = Input(UInt({width}.W))
+    val out = Output(UInt({total_width}.W))
+  }})
   
   // Concatenate high and low parts
   io.out := Cat(io.high, io.low)
-}
+}}
 """
 
 # 新增: Slice (位截取)
 TEMPLATE_SLICE = """
 import chisel3._
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
-    val in = Input(UInt({{ width }}.W))
-    val out = Output(UInt({{ slice_width }}.W))
-  })
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
+    val in = Input(UInt({width}.W))
+    val out = Output(UInt({slice_width}.W))
+  }})
   
-  // Extract bits [{{ high }}:{{ low }}]
-  io.out := io.in({{ high }}, {{ low }})
-}
+  // Extract bits [{high}:{low}]
+  io.out := io.in({high}, {low})
+}}
 """
 
 # 新增: MuxCase (多路条件选择)
@@ -375,14 +413,14 @@ TEMPLATE_MUXCASE = """
 import chisel3._
 import chisel3.util.MuxCase
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
-    val sel = Input(UInt({{ sel_width }}.W))
-    val in0 = Input(UInt({{ width }}.W))
-    val in1 = Input(UInt({{ width }}.W))
-    val in2 = Input(UInt({{ width }}.W))
-    val out = Output(UInt({{ width }}.W))
-  })
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
+    val sel = Input(UInt({sel_width}.W))
+    val in0 = Input(UInt({width}.W))
+    val in1 = Input(UInt({width}.W))
+    val in2 = Input(UInt({width}.W))
+    val out = Output(UInt({width}.W))
+  }})
   
   // Priority-based multiplexing
   io.out := MuxCase(0.U, Seq(
@@ -390,7 +428,7 @@ class {{ module_name }} extends Module {
     (io.sel === 1.U) -> io.in1,
     (io.sel === 2.U) -> io.in2
   ))
-}
+}}
 """
 
 # --- Level 3: 时序逻辑与状态机 (15%) ---
@@ -398,36 +436,36 @@ class {{ module_name }} extends Module {
 TEMPLATE_COUNTER = """
 import chisel3._
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
     val en = Input(Bool())
-    val out = Output(UInt({{ width }}.W))
-  })
+    val out = Output(UInt({width}.W))
+  }})
   
-  val cnt = RegInit(0.U({{ width }}.W))
+  val cnt = RegInit(0.U({width}.W))
   
-  when (io.en) {
+  when (io.en) {{
     cnt := cnt + 1.U
-  }
+  }}
   
   io.out := cnt
-}
+}}
 """
 
 TEMPLATE_SHIFT_REG = """
 import chisel3._
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
-    val in = Input(UInt({{ width }}.W))
-    val out = Output(UInt({{ width }}.W))
-  })
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
+    val in = Input(UInt({width}.W))
+    val out = Output(UInt({width}.W))
+  }})
   
   val r1 = RegNext(io.in)
   val r2 = RegNext(r1)
   
   io.out := r2
-}
+}}
 """
 
 # 新增: 使用 Cat 的移位寄存器变体 (针对性训练 import chisel3.util.Cat)
@@ -435,18 +473,18 @@ TEMPLATE_SHIFT_REG_CAT = """
 import chisel3._
 import chisel3.util.Cat
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
     val in = Input(UInt(1.W))
     val out = Output(UInt(1.W))
-  })
+  }})
   
-  // {{ stages }}-stage shift register using Cat
-  val reg = RegInit(0.U({{ stages }}.W))
-  reg := Cat(reg({{ stages_minus_2 }}, 0), io.in)
+  // {stages}-stage shift register using Cat
+  val reg = RegInit(0.U({stages}.W))
+  reg := Cat(reg({stages_minus_2}, 0), io.in)
   
-  io.out := reg({{ stages_minus_1 }})
-}
+  io.out := reg({stages_minus_1})
+}}
 """
 
 # 新增: FSM (有限状态机) - 使用 Enum 列表解构 (针对性训练)
@@ -454,32 +492,32 @@ TEMPLATE_FSM_ENUM_LIST = """
 import chisel3._
 import chisel3.util._
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
     val toggle = Input(Bool())
     val state = Output(Bool())
-  })
+  }})
   
   // Define states using Enum list destructuring
   val sOff :: sOn :: Nil = Enum(2)
   val stateReg = RegInit(sOff)
   
   // State transition logic
-  switch (stateReg) {
-    is (sOff) {
-      when (io.toggle) {
+  switch (stateReg) {{
+    is (sOff) {{
+      when (io.toggle) {{
         stateReg := sOn
-      }
-    }
-    is (sOn) {
-      when (io.toggle) {
+      }}
+    }}
+    is (sOn) {{
+      when (io.toggle) {{
         stateReg := sOff
-      }
-    }
-  }
+      }}
+    }}
+  }}
   
   io.state := stateReg === sOn
-}
+}}
 """
 
 # 新增: FSM (有限状态机)
@@ -487,38 +525,38 @@ TEMPLATE_FSM = """
 import chisel3._
 import chisel3.util._
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
     val start = Input(Bool())
     val done = Output(Bool())
-  })
+  }})
   
   // Define states using ChiselEnum
-  object State extends ChiselEnum {
+  object State extends ChiselEnum {{
     val sIdle, sBusy, sDone = Value
-  }
+  }}
   import State._
   
   val state = RegInit(sIdle)
   
   // State transition logic
-  switch (state) {
-    is (sIdle) {
-      when (io.start) {
+  switch (state) {{
+    is (sIdle) {{
+      when (io.start) {{
         state := sBusy
-      }
-    }
-    is (sBusy) {
+      }}
+    }}
+    is (sBusy) {{
       state := sDone
-    }
-    is (sDone) {
+    }}
+    is (sDone) {{
       state := sIdle
-    }
-  }
+    }}
+  }}
   
   // Output logic
   io.done := state === sDone
-}
+}}
 """
 
 # ==========================================
@@ -530,15 +568,15 @@ TEMPLATE_POPCOUNT = """
 import chisel3._
 import chisel3.util.PopCount
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
-    val in = Input(UInt({{ width }}.W))
-    val count = Output(UInt({{ count_width }}.W))
-  })
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
+    val in = Input(UInt({width}.W))
+    val count = Output(UInt({count_width}.W))
+  }})
   
   // Count the number of 1s in input
   io.count := PopCount(io.in)
-}
+}}
 """
 
 # 使用 Reverse (位反转)
@@ -546,15 +584,15 @@ TEMPLATE_REVERSE = """
 import chisel3._
 import chisel3.util.Reverse
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
-    val in = Input(UInt({{ width }}.W))
-    val out = Output(UInt({{ width }}.W))
-  })
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
+    val in = Input(UInt({width}.W))
+    val out = Output(UInt({width}.W))
+  }})
   
   // Reverse bit order
   io.out := Reverse(io.in)
-}
+}}
 """
 
 # 使用 Fill (位复制)
@@ -562,15 +600,15 @@ TEMPLATE_FILL = """
 import chisel3._
 import chisel3.util.Fill
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
-    val in = Input(UInt({{ width }}.W))
-    val out = Output(UInt({{ total_width }}.W))
-  })
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
+    val in = Input(UInt({width}.W))
+    val out = Output(UInt({total_width}.W))
+  }})
   
-  // Replicate input {{ times }} times
-  io.out := Fill({{ times }}, io.in)
-}
+  // Replicate input {times} times
+  io.out := Fill({times}, io.in)
+}}
 """
 
 # 使用 Log2 (计算 log2)
@@ -578,15 +616,15 @@ TEMPLATE_LOG2 = """
 import chisel3._
 import chisel3.util.Log2
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
-    val in = Input(UInt({{ width }}.W))
-    val out = Output(UInt({{ log_width }}.W))
-  })
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
+    val in = Input(UInt({width}.W))
+    val out = Output(UInt({log_width}.W))
+  }})
   
   // Compute log2 of input (position of highest 1 bit)
   io.out := Log2(io.in)
-}
+}}
 """
 
 # 使用 PriorityEncoder (优先编码器)
@@ -594,15 +632,15 @@ TEMPLATE_PRIORITY_ENCODER = """
 import chisel3._
 import chisel3.util.PriorityEncoder
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
-    val in = Input(UInt({{ width }}.W))
-    val out = Output(UInt({{ enc_width }}.W))
-  })
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
+    val in = Input(UInt({width}.W))
+    val out = Output(UInt({enc_width}.W))
+  }})
   
   // Priority encoder: returns index of lowest set bit
   io.out := PriorityEncoder(io.in)
-}
+}}
 """
 
 # 使用 OHToUInt (独热码转二进制)
@@ -610,15 +648,15 @@ TEMPLATE_OH_TO_UINT = """
 import chisel3._
 import chisel3.util.OHToUInt
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
-    val in = Input(UInt({{ width }}.W))
-    val out = Output(UInt({{ enc_width }}.W))
-  })
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
+    val in = Input(UInt({width}.W))
+    val out = Output(UInt({enc_width}.W))
+  }})
   
   // Convert one-hot encoding to binary
   io.out := OHToUInt(io.in)
-}
+}}
 """
 
 # 使用 UIntToOH (二进制转独热码)
@@ -626,15 +664,15 @@ TEMPLATE_UINT_TO_OH = """
 import chisel3._
 import chisel3.util.UIntToOH
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
-    val in = Input(UInt({{ enc_width }}.W))
-    val out = Output(UInt({{ width }}.W))
-  })
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
+    val in = Input(UInt({enc_width}.W))
+    val out = Output(UInt({width}.W))
+  }})
   
   // Convert binary to one-hot encoding
   io.out := UIntToOH(io.in)
-}
+}}
 """
 
 # 使用 Mux1H (独热码多路选择器)
@@ -642,468 +680,851 @@ TEMPLATE_MUX1H = """
 import chisel3._
 import chisel3.util.Mux1H
 
-class {{ module_name }} extends Module {
-  val io = IO(new Bundle {
+class {module_name} extends Module {{
+  val io = IO(new Bundle {{
     val sel = Input(UInt(4.W))
-    val in0 = Input(UInt({{ width }}.W))
-    val in1 = Input(UInt({{ width }}.W))
-    val in2 = Input(UInt({{ width }}.W))
-    val in3 = Input(UInt({{ width }}.W))
-    val out = Output(UInt({{ width }}.W))
-  })
+    val in0 = Input(UInt({width}.W))
+    val in1 = Input(UInt({width}.W))
+    val in2 = Input(UInt({width}.W))
+    val in3 = Input(UInt({width}.W))
+    val out = Output(UInt({width}.W))
+  }})
   
   // One-hot multiplexer
   io.out := Mux1H(io.sel, Seq(io.in0, io.in1, io.in2, io.in3))
-}
+}}
 """
 
+# ==========================================
+# 2.5 命名词库与取值池 (模块级元组常量，导入时构建一次)
+# ==========================================
+
+# --- Level 1 ---
+_L1_SUBTYPES = ("basic", "vec", "bundle")
+_L1_PREFIXES = ("Simple", "Basic", "My", "Test", "Local", "Global")
+_L1_KINDS = ("Wire", "Reg")
+_L1_TYPE_CLASSES = ("UInt", "SInt", "Bool")
+_L1_NOUNS = {
+    "vec": ("Vec", "Array", "Bus", "Buffer"),
+    "bundle": ("Bundle", "Packet", "Struct", "Interface"),
+}
+
+# --- Level 2 ---
+_L2_SUBTYPES = ("arith", "mux", "when", "cat", "slice", "muxcase")
+_L2_PREFIXES = ("Fast", "Simple", "Bitwise", "Math", "Logic")
+_L2_ARITH_OPS = (("+", "addition"), ("-", "subtraction"), ("&", "bitwise AND"), ("|", "bitwise OR"), ("^", "bitwise XOR"))
+_L2_ARITH_NOUNS = {
+    "+": ("Adder", "Sum", "Plus"),
+    "-": ("Subtractor", "Diff", "Minus"),
+    "&": ("AndGate", "Mask"),
+    "|": ("OrGate", "Merge"),
+    "^": ("XorGate", "Parity"),
+}
+_L2_NAME_PREFIXES = {
+    "mux": ("Data", "Signal", "Path"),
+    "when": ("Status", "Cond", "Branch"),
+    "cat": ("Bit", "Data", "Signal"),
+    "slice": ("Bit", "Data", "Field"),
+    "muxcase": ("Multi", "Priority", "Smart"),
+}
+_L2_NOUNS = {
+    "mux": ("Mux", "Selector", "Switch", "Chooser"),
+    "when": ("Controller", "Logic", "Flow", "Decider"),
+    "cat": ("Concat", "Merger", "Combiner", "Joiner"),
+    "slice": ("Slicer", "Extractor", "Range", "BitSelect"),
+    "muxcase": ("PriorityMux", "Selector", "Router", "Switch"),
+}
+
+# --- Level 2.5 util ---
+_L2U_SUBTYPES = (
+    "popcount", "reverse", "fill", "log2",
+    "priority_encoder", "oh_to_uint", "uint_to_oh", "mux1h"
+)
+_L2U_WIDTHS = (4, 8, 16, 32)
+# 位宽派生量查表: ceil(log2(w)) (宽度只取自 _L2U_WIDTHS)
+_L2U_CLOG2 = {w: (w - 1).bit_length() for w in _L2U_WIDTHS}
+_L2U_PREFIXES = ("Util", "Bit", "Logic", "Fast", "Smart")
+_L2U_FILL_TIMES = (2, 4, 8)
+_L2U_NOUNS = {
+    "popcount": ("PopCounter", "BitCounter", "OnesCount", "SetBitCount"),
+    "reverse": ("BitReverser", "Reverser", "BitFlip", "MirrorBits"),
+    "fill": ("BitFill", "Replicator", "BitExpand", "SignExtend"),
+    "log2": ("Log2Calc", "BitPosition", "HighBitFinder", "Log2Unit"),
+    "priority_encoder": ("PriorityEnc", "LowBitFinder", "PrioEncoder", "FirstOne"),
+    "oh_to_uint": ("OHDecoder", "OneHotToBin", "OHToUInt", "OneHotDec"),
+    "uint_to_oh": ("OHEncoder", "BinToOneHot", "UIntToOH", "OneHotEnc"),
+    "mux1h": ("Mux1H", "OneHotMux", "OHSelector", "OneHotSwitch"),
+}
+
+# --- Level 3 ---
+_L3_SUBTYPES = ("counter", "shift", "shift_cat", "fsm", "fsm_enum")
+_L3_PREFIXES = ("Cycle", "Event", "Pulse", "Data", "Sync")
+_L3_SHIFT_DEPTHS = (4, 8, 16)
+_L3_NAME_PREFIXES = {
+    "fsm": ("Simple", "Basic", "Auto"),
+    "fsm_enum": ("Auto", "Smart", "Fast"),
+}
+_L3_NOUNS = {
+    "counter": ("Counter", "Timer", "Ticker", "Watchdog"),
+    "shift": ("ShiftReg", "DelayLine", "Pipeline", "Buffer"),
+    "shift_cat": ("ShiftPipe", "CatShift", "BitShifter", "ConcatReg"),
+    "fsm": ("FSM", "StateMachine", "Controller", "Sequencer"),
+    "fsm_enum": ("ToggleFSM", "PingPong", "Alternator", "Flipper"),
+}
+
+# 所有模板类别 ("<级别>/<子类型>")，作为跨进程共享的信任计数数组的下标
+TEMPLATE_KINDS = (
+    tuple(f"L1/{subtype}" for subtype in _L1_SUBTYPES)
+    + tuple(f"L2/{subtype}" for subtype in _L2_SUBTYPES)
+    + tuple(f"L2U/{subtype}" for subtype in _L2U_SUBTYPES)
+    + tuple(f"L3/{subtype}" for subtype in _L3_SUBTYPES)
+)
+_TEMPLATE_INDEX = {kind: i for i, kind in enumerate(TEMPLATE_KINDS)}
+
 # ==========================================
 # 3. 生成函数
 # ==========================================
 
-def generate_level1(index):
+# 进程内单调递增的命名计数器: 与 PID 组合成全局唯一的标识后缀，不会像随机数那样碰撞
+_NAME_COUNTER = itertools.count()
+
+def unique_tag():
+    """生成 "<pid>_<序号>" 形式的唯一标识，用于变量名和 Bundle 类名后缀"""
+    return f"{os.getpid()}_{next(_NAME_COUNTER)}"
+
+def generate_level1(index, rng):
     """Level 1: 语法肌肉记忆 (Wire, Reg, Vec, Bundle)"""
-    subtype = random.choice(["basic", "vec", "bundle"])
-    width = random.randint(2, 32)
-    
-    # 语义化命名词库
-    prefixes = ["Simple", "Basic", "My", "Test", "Local", "Global"]
+    subtype = rng.choice(_L1_SUBTYPES)
+    width = rng.randint(2, 32)
+    tag = unique_tag()
     
     if subtype == "basic":
-        kind = random.choice(["Wire", "Reg"])
-        type_class = random.choice(["UInt", "SInt", "Bool"])
+        kind = rng.choice(_L1_KINDS)
+        type_class = rng.choice(_L1_TYPE_CLASSES)
         if type_class == "Bool": width = 1
         
         # 命名策略: [Prefix][Type][Kind] e.g. SimpleUIntReg
-        base_name = f"{type_class}{kind}" if random.random() > 0.5 else kind
-        module_name = f"{random.choice(prefixes)}{base_name}_{index}"
+        base_name = f"{type_class}{kind}" if rng.random() > 0.5 else kind
+        module_name = f"{rng.choice(_L1_PREFIXES)}{base_name}_{index}"
         
-        var_name = f"v_{random.randint(100, 999)}"
+        var_name = f"v_{tag}"
         
-        t = Template(TEMPLATE_BASIC_TYPE)
-        code = t.render(module_name=module_name, type_class=type_class, width=width, kind=kind, var_name=var_name).strip()
-        instruction = get_random_instruction("basic_type", width=width, type_class=type_class, kind=kind, var_name=var_name)
+        # Bool 不带位宽，初值用 false.B; 其余类型按位宽构造，初值为 0 转换到该类型
+        if type_class == "Bool":
+            data_type, init_value = "Bool()", "false.B"
+        else:
+            data_type, init_value = f"{type_class}({width}.W)", f"0.U.asTypeOf({var_name})"
+        code = TEMPLATE_BASIC_TYPE.format(module_name=module_name, type_class=type_class, kind=kind,
+                                          var_name=var_name, data_type=data_type, init_value=init_value).strip()
+        instruction = get_random_instruction("basic_type", rng, width=width, type_class=type_class, kind=kind, var_name=var_name)
         
     elif subtype == "vec":
-        size = random.randint(2, 8)
+        size = rng.randint(2, 8)
         
         # 命名策略: [Prefix][Noun] e.g. BasicDataBus
-        nouns = ["Vec", "Array", "Bus", "Buffer"]
-        module_name = f"{random.choice(prefixes)}{random.choice(nouns)}_{index}"
+        module_name = f"{rng.choice(_L1_PREFIXES)}{rng.choice(_L1_NOUNS['vec'])}_{index}"
         
-        var_name = f"vec_{random.randint(100, 999)}"
+        var_name = f"vec_{tag}"
         
-        t = Template(TEMPLATE_VEC)
-        code = t.render(module_name=module_name, size=size, type_class="UInt", width=width, var_name=var_name).strip()
-        instruction = get_random_instruction("vec", size=size, width=width)
+        code = TEMPLATE_VEC.format(module_name=module_name, size=size, type_class="UInt", width=width, var_name=var_name).strip()
+        instruction = get_random_instruction("vec", rng, size=size, width=width)
         
     else: # bundle
         # 命名策略: [Prefix][Noun] e.g. CustomPacket
-        nouns = ["Bundle", "Packet", "Struct", "Interface"]
-        module_name = f"{random.choice(prefixes)}{random.choice(nouns)}_{index}"
+        module_name = f"{rng.choice(_L1_PREFIXES)}{rng.choice(_L1_NOUNS['bundle'])}_{index}"
         
-        var_name = f"blob_{random.randint(100, 999)}"
-        suffix = random.randint(1000, 9999)  # 生成随机后缀确保唯一性
+        var_name = f"blob_{tag}"
+        suffix = tag  # 唯一后缀确保 Bundle 类名全局唯一
         
-        t = Template(TEMPLATE_BUNDLE)
-        code = t.render(module_name=module_name, index=index, suffix=suffix, width=width, var_name=var_name).strip()
-        instruction = get_random_instruction("bundle", width=width)
+        code = TEMPLATE_BUNDLE.format(module_name=module_name, index=index, suffix=suffix, width=width, var_name=var_name).strip()
+        instruction = get_random_instruction("bundle", rng, width=width)
 
-    return {"module_name": module_name, "entry": {"instruction": instruction, "input": "", "output": code}}
+    # 生成的标识随样本返回，结构指纹计算时与模块名一起屏蔽:
+    # Bundle 类名后缀 "{index}_{tag}" 含样本编号，需先于 tag 整体屏蔽
+    tags = (f"{index}_{tag}", tag)
+    return {"module_name": module_name, "template": f"L1/{subtype}", "tags": tags, "entry": {"instruction": instruction, "input": "", "output": code}}
 
-def generate_level2(index):
+# --- Level 2 各子类型的生成函数: (index, width, rng) -> (module_name, code, instruction) ---
+
+def _gen_l2_arith(index, width, rng):
+    op_symbol, op_name = rng.choice(_L2_ARITH_OPS)
+    
+    # 命名策略: 根据操作符决定核心名词
+    base = rng.choice(_L2_ARITH_NOUNS.get(op_symbol, ("ALU",)))
+    module_name = f"{rng.choice(_L2_PREFIXES)}{base}_{index}"
+    
+    code = TEMPLATE_ARITHMETIC.format(module_name=module_name, width=width, op_symbol=op_symbol, op_name=op_name).strip()
+    return module_name, code, get_random_instruction("arithmetic", rng, width=width, op_name=op_name)
+
+def _gen_l2_mux(index, width, rng):
+    # 命名策略: Mux 相关
+    module_name = f"{rng.choice(_L2_NAME_PREFIXES['mux'])}{rng.choice(_L2_NOUNS['mux'])}_{index}"
+    
+    code = TEMPLATE_MUX.format(module_name=module_name, width=width).strip()
+    return module_name, code, get_random_instruction("mux", rng, width=width)
+
+def _gen_l2_when(index, width, rng):
+    # 命名策略: 逻辑控制相关
+    module_name = f"{rng.choice(_L2_NAME_PREFIXES['when'])}{rng.choice(_L2_NOUNS['when'])}_{index}"
+    
+    code = TEMPLATE_WHEN.format(module_name=module_name, width=width).strip()
+    return module_name, code, get_random_instruction("when", rng)
+
+def _gen_l2_cat(index, width, rng):
+    # Cat 位拼接
+    module_name = f"{rng.choice(_L2_NAME_PREFIXES['cat'])}{rng.choice(_L2_NOUNS['cat'])}_{index}"
+    
+    total_width = width * 2
+    code = TEMPLATE_CAT.format(module_name=module_name, width=width, total_width=total_width).strip()
+    return module_name, code, get_random_instruction("cat", rng, width=width, total_width=total_width)
+
+def _gen_l2_slice(index, width, rng):
+    # Slice 位截取
+    module_name = f"{rng.choice(_L2_NAME_PREFIXES['slice'])}{rng.choice(_L2_NOUNS['slice'])}_{index}"
+    
+    # 确保 high > low 且不超过 width
+    low = rng.randint(0, width - 2)
+    high = rng.randint(low + 1, width - 1)
+    slice_width = high - low + 1
+    
+    code = TEMPLATE_SLICE.format(module_name=module_name, width=width, high=high, low=low, slice_width=slice_width).strip()
+    return module_name, code, get_random_instruction("slice", rng, width=width, high=high, low=low)
+
+def _gen_l2_muxcase(index, width, rng):
+    # MuxCase 多路选择
+    module_name = f"{rng.choice(_L2_NAME_PREFIXES['muxcase'])}{rng.choice(_L2_NOUNS['muxcase'])}_{index}"
+    
+    sel_width = 2  # 3 个输入需要 2 bit 选择信号
+    num_cases = 3
+    
+    code = TEMPLATE_MUXCASE.format(module_name=module_name, width=width, sel_width=sel_width).strip()
+    return module_name, code, get_random_instruction("mux_case", rng, num_cases=num_cases)
+
+_L2_HANDLERS = {
+    "arith": _gen_l2_arith,
+    "mux": _gen_l2_mux,
+    "when": _gen_l2_when,
+    "cat": _gen_l2_cat,
+    "slice": _gen_l2_slice,
+    "muxcase": _gen_l2_muxcase,
+}
+
+def generate_level2(index, rng):
     """Level 2: 基础组合逻辑 (Arithmetic, Mux, When, Cat, Slice, MuxCase)"""
-    subtype = random.choice(["arith", "mux", "when", "cat", "slice", "muxcase"])
-    width = random.randint(4, 32)
+    subtype = rng.choice(_L2_SUBTYPES)
+    width = rng.randint(4, 32)
     
-    prefixes = ["Fast", "Simple", "Bitwise", "Math", "Logic"]
+    module_name, code, instruction = _L2_HANDLERS[subtype](index, width, rng)
+
+    return {"module_name": module_name, "template": f"L2/{subtype}", "entry": {"instruction": instruction, "input": "", "output": code}}
+
+# --- Level 2.5 util 各子类型的生成函数: (index, width, rng) -> (module_name, code, instruction) ---
+
+def _gen_l2u_popcount(index, width, rng):
+    module_name = f"{rng.choice(_L2U_PREFIXES)}{rng.choice(_L2U_NOUNS['popcount'])}_{index}"
     
-    if subtype == "arith":
-        ops = [("+", "addition"), ("-", "subtraction"), ("&", "bitwise AND"), ("|", "bitwise OR"), ("^", "bitwise XOR")]
-        op_symbol, op_name = random.choice(ops)
-        
-        # 命名策略: 根据操作符决定核心名词
-        op_map = {
-            "+": ["Adder", "Sum", "Plus"],
-            "-": ["Subtractor", "Diff", "Minus"],
-            "&": ["AndGate", "Mask"],
-            "|": ["OrGate", "Merge"],
-            "^": ["XorGate", "Parity"]
-        }
-        base = random.choice(op_map.get(op_symbol, ["ALU"]))
-        module_name = f"{random.choice(prefixes)}{base}_{index}"
-        
-        t = Template(TEMPLATE_ARITHMETIC)
-        code = t.render(module_name=module_name, width=width, op_symbol=op_symbol, op_name=op_name).strip()
-        instruction = get_random_instruction("arithmetic", width=width, op_name=op_name)
-        
-    elif subtype == "mux":
-        # 命名策略: Mux 相关
-        nouns = ["Mux", "Selector", "Switch", "Chooser"]
-        module_name = f"{random.choice(['Data', 'Signal', 'Path'])}{random.choice(nouns)}_{index}"
-        
-        t = Template(TEMPLATE_MUX)
-        code = t.render(module_name=module_name, width=width).strip()
-        instruction = get_random_instruction("mux", width=width)
-        
-    elif subtype == "when":
-        # 命名策略: 逻辑控制相关
-        nouns = ["Controller", "Logic", "Flow", "Decider"]
-        module_name = f"{random.choice(['Status', 'Cond', 'Branch'])}{random.choice(nouns)}_{index}"
-        
-        t = Template(TEMPLATE_WHEN)
-        code = t.render(module_name=module_name, width=width).strip()
-        instruction = get_random_instruction("when")
+    # log2(width) + 1 bits to hold count
+    count_width = _L2U_CLOG2[width] + 1
     
-    elif subtype == "cat":
-        # 新增: Cat 位拼接
-        nouns = ["Concat", "Merger", "Combiner", "Joiner"]
-        module_name = f"{random.choice(['Bit', 'Data', 'Signal'])}{random.choice(nouns)}_{index}"
-        
-        total_width = width * 2
-        t = Template(TEMPLATE_CAT)
-        code = t.render(module_name=module_name, width=width, total_width=total_width).strip()
-        instruction = get_random_instruction("cat", width=width, total_width=total_width)
+    code = TEMPLATE_POPCOUNT.format(module_name=module_name, width=width, count_width=count_width).strip()
+    return module_name, code, get_random_instruction("popcount", rng, width=width)
+
+def _gen_l2u_reverse(index, width, rng):
+    module_name = f"{rng.choice(_L2U_PREFIXES)}{rng.choice(_L2U_NOUNS['reverse'])}_{index}"
     
-    elif subtype == "slice":
-        # 新增: Slice 位截取
-        nouns = ["Slicer", "Extractor", "Range", "BitSelect"]
-        module_name = f"{random.choice(['Bit', 'Data', 'Field'])}{random.choice(nouns)}_{index}"
-        
-        # 确保 high > low 且不超过 width
-        low = random.randint(0, width - 2)
-        high = random.randint(low + 1, width - 1)
-        slice_width = high - low + 1
-        
-        t = Template(TEMPLATE_SLICE)
-        code = t.render(module_name=module_name, width=width, high=high, low=low, slice_width=slice_width).strip()
-        instruction = get_random_instruction("slice", width=width, high=high, low=low)
+    code = TEMPLATE_REVERSE.format(module_name=module_name, width=width).strip()
+    return module_name, code, get_random_instruction("reverse", rng, width=width)
+
+def _gen_l2u_fill(index, width, rng):
+    module_name = f"{rng.choice(_L2U_PREFIXES)}{rng.choice(_L2U_NOUNS['fill'])}_{index}"
     
-    else: # muxcase
-        # 新增: MuxCase 多路选择
-        nouns = ["PriorityMux", "Selector", "Router", "Switch"]
-        module_name = f"{random.choice(['Multi', 'Priority', 'Smart'])}{random.choice(nouns)}_{index}"
-        
-        sel_width = 2  # 3 个输入需要 2 bit 选择信号
-        num_cases = 3
-        
-        t = Template(TEMPLATE_MUXCASE)
-        code = t.render(module_name=module_name, width=width, sel_width=sel_width).strip()
-        instruction = get_random_instruction("mux_case", num_cases=num_cases)
+    times = rng.choice(_L2U_FILL_TIMES)
+    total_width = width * times
+    
+    code = TEMPLATE_FILL.format(module_name=module_name, width=width, times=times, total_width=total_width).strip()
+    return module_name, code, get_random_instruction("fill", rng, width=width, times=times)
+
+def _gen_l2u_log2(index, width, rng):
+    module_name = f"{rng.choice(_L2U_PREFIXES)}{rng.choice(_L2U_NOUNS['log2'])}_{index}"
+    
+    log_width = _L2U_CLOG2[width]
+    
+    code = TEMPLATE_LOG2.format(module_name=module_name, width=width, log_width=log_width).strip()
+    return module_name, code, get_random_instruction("log2", rng, width=width)
 
-    return {"module_name": module_name, "entry": {"instruction": instruction, "input": "", "output": code}}
+def _gen_l2u_priority_encoder(index, width, rng):
+    module_name = f"{rng.choice(_L2U_PREFIXES)}{rng.choice(_L2U_NOUNS['priority_encoder'])}_{index}"
+    
+    enc_width = _L2U_CLOG2[width]
+    
+    code = TEMPLATE_PRIORITY_ENCODER.format(module_name=module_name, width=width, enc_width=enc_width).strip()
+    return module_name, code, get_random_instruction("priority_encoder", rng, width=width)
 
-def generate_level2_util(index):
-    """Level 2.5: chisel3.util 专项训练 (PopCount, Reverse, Fill, Log2, PriorityEncoder, etc.)"""
-    subtype = random.choice([
-        "popcount", "reverse", "fill", "log2", 
-        "priority_encoder", "oh_to_uint", "uint_to_oh", "mux1h"
-    ])
-    width = random.choice([4, 8, 16, 32])
+def _gen_l2u_oh_to_uint(index, width, rng):
+    module_name = f"{rng.choice(_L2U_PREFIXES)}{rng.choice(_L2U_NOUNS['oh_to_uint'])}_{index}"
     
-    prefixes = ["Util", "Bit", "Logic", "Fast", "Smart"]
+    enc_width = _L2U_CLOG2[width]
     
-    if subtype == "popcount":
-        nouns = ["PopCounter", "BitCounter", "OnesCount", "SetBitCount"]
-        module_name = f"{random.choice(prefixes)}{random.choice(nouns)}_{index}"
-        
-        # log2(width) + 1 bits to hold count
-        count_width = (width - 1).bit_length() + 1
-        
-        t = Template(TEMPLATE_POPCOUNT)
-        code = t.render(module_name=module_name, width=width, count_width=count_width).strip()
-        instruction = get_random_instruction("popcount", width=width)
-        
-    elif subtype == "reverse":
-        nouns = ["BitReverser", "Reverser", "BitFlip", "MirrorBits"]
-        module_name = f"{random.choice(prefixes)}{random.choice(nouns)}_{index}"
-        
-        t = Template(TEMPLATE_REVERSE)
-        code = t.render(module_name=module_name, width=width).strip()
-        instruction = get_random_instruction("reverse", width=width)
-        
-    elif subtype == "fill":
-        nouns = ["BitFill", "Replicator", "BitExpand", "SignExtend"]
-        module_name = f"{random.choice(prefixes)}{random.choice(nouns)}_{index}"
-        
-        times = random.choice([2, 4, 8])
-        total_width = width * times
-        
-        t = Template(TEMPLATE_FILL)
-        code = t.render(module_name=module_name, width=width, times=times, total_width=total_width).strip()
-        instruction = get_random_instruction("fill", width=width, times=times)
-        
-    elif subtype == "log2":
-        nouns = ["Log2Calc", "BitPosition", "HighBitFinder", "Log2Unit"]
-        module_name = f"{random.choice(prefixes)}{random.choice(nouns)}_{index}"
-        
-        log_width = (width - 1).bit_length()
-        
-        t = Template(TEMPLATE_LOG2)
-        code = t.render(module_name=module_name, width=width, log_width=log_width).strip()
-        instruction = get_random_instruction("log2", width=width)
-        
-    elif subtype == "priority_encoder":
-        nouns = ["PriorityEnc", "LowBitFinder", "PrioEncoder", "FirstOne"]
-        module_name = f"{random.choice(prefixes)}{random.choice(nouns)}_{index}"
-        
-        enc_width = (width - 1).bit_length()
-        
-        t = Template(TEMPLATE_PRIORITY_ENCODER)
-        code = t.render(module_name=module_name, width=width, enc_width=enc_width).strip()
-        instruction = get_random_instruction("priority_encoder", width=width)
-        
-    elif subtype == "oh_to_uint":
-        nouns = ["OHDecoder", "OneHotToBin", "OHToUInt", "OneHotDec"]
-        module_name = f"{random.choice(prefixes)}{random.choice(nouns)}_{index}"
-        
-        enc_width = (width - 1).bit_length()
-        
-        t = Template(TEMPLATE_OH_TO_UINT)
-        code = t.render(module_name=module_name, width=width, enc_width=enc_width).strip()
-        instruction = get_random_instruction("onehot_convert", width=width)
-        
-    elif subtype == "uint_to_oh":
-        nouns = ["OHEncoder", "BinToOneHot", "UIntToOH", "OneHotEnc"]
-        module_name = f"{random.choice(prefixes)}{random.choice(nouns)}_{index}"
-        
-        enc_width = (width - 1).bit_length()
-        
-        t = Template(TEMPLATE_UINT_TO_OH)
-        code = t.render(module_name=module_name, width=width, enc_width=enc_width).strip()
-        instruction = get_random_instruction("binary_to_onehot", width=width, enc_width=enc_width)
-        
-    else:  # mux1h
-        nouns = ["Mux1H", "OneHotMux", "OHSelector", "OneHotSwitch"]
-        module_name = f"{random.choice(prefixes)}{random.choice(nouns)}_{index}"
-        
-        t = Template(TEMPLATE_MUX1H)
-        code = t.render(module_name=module_name, width=width).strip()
-        instruction = get_random_instruction("mux1h", width=width)
+    code = TEMPLATE_OH_TO_UINT.format(module_name=module_name, width=width, enc_width=enc_width).strip()
+    return module_name, code, get_random_instruction("onehot_convert", rng, width=width)
+
+def _gen_l2u_uint_to_oh(index, width, rng):
+    module_name = f"{rng.choice(_L2U_PREFIXES)}{rng.choice(_L2U_NOUNS['uint_to_oh'])}_{index}"
+    
+    enc_width = _L2U_CLOG2[width]
+    
+    code = TEMPLATE_UINT_TO_OH.format(module_name=module_name, width=width, enc_width=enc_width).strip()
+    return module_name, code, get_random_instruction("binary_to_onehot", rng, width=width, enc_width=enc_width)
+
+def _gen_l2u_mux1h(index, width, rng):
+    module_name = f"{rng.choice(_L2U_PREFIXES)}{rng.choice(_L2U_NOUNS['mux1h'])}_{index}"
+    
+    code = TEMPLATE_MUX1H.format(module_name=module_name, width=width).strip()
+    return module_name, code, get_random_instruction("mux1h", rng, width=width)
+
+_L2U_HANDLERS = {
+    "popcount": _gen_l2u_popcount,
+    "reverse": _gen_l2u_reverse,
+    "fill": _gen_l2u_fill,
+    "log2": _gen_l2u_log2,
+    "priority_encoder": _gen_l2u_priority_encoder,
+    "oh_to_uint": _gen_l2u_oh_to_uint,
+    "uint_to_oh": _gen_l2u_uint_to_oh,
+    "mux1h": _gen_l2u_mux1h,
+}
+
+def generate_level2_util(index, rng):
+    """Level 2.5: chisel3.util 专项训练 (PopCount, Reverse, Fill, Log2, PriorityEncoder, etc.)"""
+    subtype = rng.choice(_L2U_SUBTYPES)
+    width = rng.choice(_L2U_WIDTHS)
+    
+    module_name, code, instruction = _L2U_HANDLERS[subtype](index, width, rng)
     
-    return {"module_name": module_name, "entry": {"instruction": instruction, "input": "", "output": code}}
+    return {"module_name": module_name, "template": f"L2U/{subtype}", "entry": {"instruction": instruction, "input": "", "output": code}}
 
-def generate_level3(index):
+def generate_level3(index, rng):
     """Level 3: 时序逻辑与状态机 (Counter, ShiftReg, FSM) - 含 chisel3.util 变体"""
     # 增加 shift_cat 和 fsm_enum 变体，确保模型学会 import chisel3.util._
-    subtype = random.choice(["counter", "shift", "shift_cat", "fsm", "fsm_enum"])
-    width = random.randint(4, 16)
-    
-    prefixes = ["Cycle", "Event", "Pulse", "Data", "Sync"]
+    subtype = rng.choice(_L3_SUBTYPES)
+    width = rng.randint(4, 16)
     
     if subtype == "counter":
         # 命名策略: 计数器相关
-        nouns = ["Counter", "Timer", "Ticker", "Watchdog"]
-        module_name = f"{random.choice(prefixes)}{random.choice(nouns)}_{index}"
+        module_name = f"{rng.choice(_L3_PREFIXES)}{rng.choice(_L3_NOUNS['counter'])}_{index}"
         
-        t = Template(TEMPLATE_COUNTER)
-        code = t.render(module_name=module_name, width=width).strip()
-        instruction = get_random_instruction("counter", width=width)
+        code = TEMPLATE_COUNTER.format(module_name=module_name, width=width).strip()
+        instruction = get_random_instruction("counter", rng, width=width)
         
     elif subtype == "shift":
         # 命名策略: 移位寄存器相关 (基础版，不使用 Cat)
-        nouns = ["ShiftReg", "DelayLine", "Pipeline", "Buffer"]
-        module_name = f"{random.choice(prefixes)}{random.choice(nouns)}_{index}"
+        module_name = f"{rng.choice(_L3_PREFIXES)}{rng.choice(_L3_NOUNS['shift'])}_{index}"
         
-        t = Template(TEMPLATE_SHIFT_REG)
-        code = t.render(module_name=module_name, width=width).strip()
-        instruction = get_random_instruction("shift_reg")
+        code = TEMPLATE_SHIFT_REG.format(module_name=module_name, width=width).strip()
+        instruction = get_random_instruction("shift_reg", rng)
     
     elif subtype == "shift_cat":
         # 移位寄存器使用 Cat (显式 import chisel3.util._)
-        nouns = ["ShiftPipe", "CatShift", "BitShifter", "ConcatReg"]
-        module_name = f"{random.choice(prefixes)}{random.choice(nouns)}_{index}"
+        module_name = f"{rng.choice(_L3_PREFIXES)}{rng.choice(_L3_NOUNS['shift_cat'])}_{index}"
         
-        depth = random.choice([4, 8, 16])
+        depth = rng.choice(_L3_SHIFT_DEPTHS)
         
-        t = Template(TEMPLATE_SHIFT_REG_CAT)
-        code = t.render(module_name=module_name, width=width, depth=depth).strip()
-        instruction = get_random_instruction("shift_cat", depth=depth)
+        code = TEMPLATE_SHIFT_REG_CAT.format(
+            module_name=module_name, stages=depth,
+            stages_minus_1=depth - 1, stages_minus_2=depth - 2
+        ).strip()
+        instruction = get_random_instruction("shift_cat", rng, stages=depth)
     
     elif subtype == "fsm":
         # 基础 FSM (ChiselEnum 推导)
-        nouns = ["FSM", "StateMachine", "Controller", "Sequencer"]
-        module_name = f"{random.choice(['Simple', 'Basic', 'Auto'])}{random.choice(nouns)}_{index}"
+        module_name = f"{rng.choice(_L3_NAME_PREFIXES['fsm'])}{rng.choice(_L3_NOUNS['fsm'])}_{index}"
         
         num_states = 3
         state_names = "Idle, Busy, Done"
         
-        t = Template(TEMPLATE_FSM)
-        code = t.render(module_name=module_name).strip()
-        instruction = get_random_instruction("fsm", num_states=num_states, state_names=state_names)
+        code = TEMPLATE_FSM.format(module_name=module_name).strip()
+        instruction = get_random_instruction("fsm", rng, num_states=num_states, state_names=state_names)
     
     else:  # fsm_enum
         # FSM 使用 Enum list 解构 (显式 import chisel3.util._)
-        nouns = ["ToggleFSM", "PingPong", "Alternator", "Flipper"]
-        module_name = f"{random.choice(['Auto', 'Smart', 'Fast'])}{random.choice(nouns)}_{index}"
+        module_name = f"{rng.choice(_L3_NAME_PREFIXES['fsm_enum'])}{rng.choice(_L3_NOUNS['fsm_enum'])}_{index}"
         
-        t = Template(TEMPLATE_FSM_ENUM_LIST)
-        code = t.render(module_name=module_name).strip()
-        instruction = get_random_instruction("fsm_toggle")
+        code = TEMPLATE_FSM_ENUM_LIST.format(module_name=module_name).strip()
+        instruction = get_random_instruction("fsm_toggle", rng)
 
-    return {"module_name": module_name, "entry": {"instruction": instruction, "input": "", "output": code}}
+    return {"module_name": module_name, "template": f"L3/{subtype}", "entry": {"instruction": instruction, "input": "", "output": code}}
 
 # ==========================================
 # 4. 验证与主循环
 # ==========================================
 
-def validate_code(code, module_name, index, log_file):
-    """验证代码并记录错误"""
-    try:
-        result = reflect(
-            chisel_code_string=code,
-            module_name=module_name,
-            testbench_path=None,
-            output_dir=None,
-            verilog_file=None,
-            result_file=None,
-            silent=True  # 开启静默模式，避免干扰 tqdm 进度条
-        )
+# 每次 JVM 调用批量验证的样本数: JVM 启动与 Chisel 类加载是验证阶段的主要开销，
+# 一批几十个样本可将其摊薄到可以忽略
+VALIDATE_BATCH_SIZE = 64
+
+# 尝试样本数达到目标数的多少倍后放弃 (任务流是无限的，防止环境异常时无休止运行)
+MAX_ATTEMPTS_FACTOR = 10
+
+# 每个 worker 处理多少批任务后被回收重建，限制长时间运行时 worker 的内存膨胀
+# (每批 VALIDATE_BATCH_SIZE 个样本，重建的代价是新 worker 的 Mill server 冷启动)
+DEFAULT_MAXTASKS_PER_CHILD = 50
+
+# 模板信任机制: 某类模板连续 TRUST_AFTER 次真实验证通过后视为可信，
+# 之后该类样本只抽 TRUSTED_RECHECK_RATE 的比例继续验证，一旦复检失败即撤销信任
+TRUST_AFTER = 200
+TRUSTED_RECHECK_RATE = 0.01
+
+# 各模板类别的连续通过次数 (跨进程共享的 multiprocessing.Array，由 init_worker 设置)
+_TRUST_STREAKS = None
+
+# 每个 worker 的内存预算 (MB): Mill 后台 server 加上每批 fork 出的阐述 JVM 的常驻内存
+PER_WORKER_MB = 1500
+# 默认 worker 数最多占用物理内存的比例，其余留给系统和主进程
+MEMORY_BUDGET_FRACTION = 0.7
+
+# golden 测试为凑齐每类模板的一个样本最多生成的样本数
+GOLDEN_MAX_DRAWS = 10000
+
+# worker 启动时对自己的工作区预热的轮数
+WORKER_WARMUP_ROUNDS = 2
+
+# 每个 worker 进程独占的 Mill 工作区 (由 init_worker 创建)
+_WORKSPACE = None
+
+# 每个 worker 进程的随机数生成器，只在 init_worker 中播种一次，跨任务延续状态
+_RNG = random.Random()
+
+# 每个 worker 进程内的结构验证结论 (结构指纹 -> 是否通过)，由 init_worker 以历史结论初始化
+_VALIDATION_CACHE = {}
+
+def init_worker(workspace_root, known_verdicts, base_seed, log_queue, trust_streaks):
+    """
+    进程池初始化: 为当前 worker 创建持久工作区、载入已知的验证结论、接入日志队列与模板信任计数，
+    并播种随机数生成器。
+    种子由 base_seed 与 PID 拼接后经 SHA-512 派生 (random.seed 对 str 种子的处理)，
+    各 worker (包括回收后重建的 worker) 的随机序列互不相同且互不相关。
+    Mill 按工作区常驻一个后台 server (JVM)，之后各批次复用同一个 JVM，
+    类路径解析、Scala 编译器和 Chisel 类加载只在首批付出一次
+    """
+    global _WORKSPACE, _LOG_QUEUE, _TRUST_STREAKS
+    _WORKSPACE = tempfile.mkdtemp(prefix="worker_", dir=workspace_root)
+    _LOG_QUEUE = log_queue
+    _TRUST_STREAKS = trust_streaks
+    _VALIDATION_CACHE.update(known_verdicts)
+    _RNG.seed(f"{base_seed}/{os.getpid()}")
+    # worker 因 maxtasksperchild 正常退出时关闭自己的 Mill server，避免残留 JVM。
+    # 池中 worker 以 os._exit 结束，atexit 不会执行，需注册 multiprocessing 的退出回调
+    multiprocessing.util.Finalize(None, close_workspace, args=(_WORKSPACE,), exitpriority=10)
+    # 在接第一批真实任务前先跑几轮预热，让 Mill server 启动、JIT 分层编译趋于稳定
+    for _ in range(WORKER_WARMUP_ROUNDS):
+        warmup(workspace_dir=_WORKSPACE)
+
+def validate_batch(samples):
+    """
+    在一次 JVM 调用中批量验证多个样本并记录错误。
+    结构指纹已有结论的样本直接复用结论; 其余样本中可信模板的 (除抽中复检的以外) 直接判为通过，
+    同批内结构相同的样本只送一个代表去验证。
+    
+    Args:
+        samples: [(index, sample), ...]，sample 为 generate_level* 的返回值
         
-        if result['compiled'] and result['elaborated']:
-            return True
-        else:
-            # 记录验证失败的详细信息
-            error_stage = "compilation" if not result['compiled'] else "elaboration"
-            error_info = f"Stage: {error_stage}\n"
-            if 'error_log' in result:
-                error_info += f"Error Log:\n{result['error_log']}\n"
-            error_info += f"\nCode:\n{code}\n"
-            log_error(log_file, index, module_name, error_info)
-            return False
-            
-    except Exception as e:
-        error_info = f"Exception: {str(e)}\nCode:\n{code}\n"
-        log_error(log_file, index, module_name, error_info)
+    Returns:
+        (verdicts, keys, new_verdicts): 与 samples 一一对应的布尔值列表与结构指纹列表，
+        以及本批新得到的确定结论 {结构指纹: bool} (结论未知的结构不包含在内)
+    """
+    keys = [shape_key(sample["entry"]["output"], sample["module_name"], sample.get("tags", ())) for _, sample in samples]
+    # 已有结论的结构直接用结论 (缓存的失败结论优先于模板信任)，信任只用于跳过未知结构的验证
+    trusted = [key not in _VALIDATION_CACHE and is_trusted(sample["template"]) for key, (_, sample) in zip(keys, samples)]
+    
+    # 每个未知结构只挑一个代表，并记下代表所属的模板类别
+    pending = {}
+    template_of = {}
+    for key, skip, (_, sample) in zip(keys, trusted, samples):
+        if not skip and key not in _VALIDATION_CACHE and key not in pending:
+            pending[key] = (sample["module_name"], sample["entry"]["output"])
+            template_of[key] = sample["template"]
+    
+    new_verdicts = {}
+    if pending:
+        try:
+            passed = reflect_batch(list(pending.values()), timeout=600, silent=True, workspace_dir=_WORKSPACE)
+        except Exception as e:
+            for index, sample in samples:
+                error_info = f"Batch Exception: {str(e)}\nCode:\n{sample['entry']['output']}\n"
+                log_error(index, sample["module_name"], error_info)
+            return [False] * len(samples), keys, new_verdicts
+        # 结论未知 (Mill 超时、无法定位的编译失败) 的结构不写入缓存: 本批样本按未通过处理，
+        # 之后同结构的样本重新验证，而不是被一次环境故障连带拒收
+        new_verdicts = {key: ok for key, ok in zip(pending, passed) if ok is not None}
+        _VALIDATION_CACHE.update(new_verdicts)
+    
+    verdicts = [True if skip else _VALIDATION_CACHE.get(key, False) for key, skip in zip(keys, trusted)]
+    # 每次真实阐述 (每个送验的代表) 计一次连续通过次数，同结构的其它样本不重复计入
+    update_trust([template_of[key] for key in new_verdicts], list(new_verdicts.values()))
+    for key, (index, sample), ok in zip(keys, samples, verdicts):
+        if not ok:
+            # 批量模式下编译器输出是整批共享的，这里只记录失败样本的代码
+            if key in new_verdicts:
+                stage = "batch compilation/elaboration"
+            elif key in _VALIDATION_CACHE:
+                stage = "cached verdict"
+            else:
+                stage = "batch result unknown (timeout or unattributable compile failure)"
+            error_info = f"Stage: {stage}\n\nCode:\n{sample['entry']['output']}\n"
+            log_error(index, sample["module_name"], error_info)
+    return verdicts, keys, new_verdicts
+
+def is_trusted(template):
+    """判断该类模板当前是否可信且本次未被抽中复检"""
+    if _TRUST_STREAKS is None:
+        return False
+    return _TRUST_STREAKS[_TEMPLATE_INDEX[template]] >= TRUST_AFTER and _RNG.random() >= TRUSTED_RECHECK_RATE
+
+def update_trust(templates, outcomes):
+    """按真实验证结果更新各模板的连续通过次数: 通过加一，失败清零 (撤销信任)"""
+    if _TRUST_STREAKS is None or not templates:
+        return
+    with _TRUST_STREAKS.get_lock():
+        for template, ok in zip(templates, outcomes):
+            i = _TEMPLATE_INDEX[template]
+            _TRUST_STREAKS[i] = _TRUST_STREAKS[i] + 1 if ok else 0
+
+# 课程分布: Level 1 (45%) | Level 2 (30%) | Level 2.5 util (10%) | Level 3 (15%)
+# Level 2.5 专门训练 chisel3.util 相关的 API (PopCount, Reverse, Fill, Log2, etc.)
+CURRICULUM = (generate_level1, generate_level2, generate_level2_util, generate_level3)
+CURRICULUM_CUM_WEIGHTS = (0.45, 0.75, 0.85, 1.0)
+
+def generate_sample(index, rng):
+    """按课程分布随机生成一个样本"""
+    generator = rng.choices(CURRICULUM, cum_weights=CURRICULUM_CUM_WEIGHTS)[0]
+    return generator(index, rng)
+
+def worker_task(batch):
+    """
+    多进程工作函数: 生成一批样本，并用一次 reflect_batch 调用验证整批
+    
+    Args:
+        batch: 样本编号序列 (range)
+        
+    Returns:
+        (results, new_verdicts): results 与 batch 一一对应，验证通过为 (结构指纹, entry)，否则为 None;
+        new_verdicts 为本批新得到的结构验证结论，交给主进程汇总持久化
+    """
+    results = [None] * len(batch)
+    samples = []  # [(position, index, sample)]
+    
+    for pos, index in enumerate(batch):
+        try:
+            samples.append((pos, index, generate_sample(index, _RNG)))
+        except Exception as e:
+            # 捕获并记录生成阶段的异常
+            log_error(index, "UNKNOWN", f"Generation Exception: {str(e)}")
+    
+    if not samples:
+        return results, {}
+    
+    verdicts, keys, new_verdicts = validate_batch([(index, sample) for _, index, sample in samples])
+    for (pos, _, sample), key, ok in zip(samples, keys, verdicts):
+        if ok:
+            results[pos] = (key, sample["entry"])
+    return results, new_verdicts
+
+def warmup(timeout=900, workspace_dir=None):
+    """
+    预热: 用一个极小的模块完整走一遍编译与阐述。
+    主进程在创建进程池前调用一次: 首次运行时 Coursier 下载 Chisel/FIRRTL 依赖、Mill 自举
+    都在这里一次完成并写入共享缓存，避免所有 worker 在第一批任务里同时解析依赖、互相争抢下载。
+    worker 在 init_worker 中对自己的工作区调用: 拉起常驻 Mill server 并让 JIT 先跑热编译器和 Chisel
+    
+    Args:
+        timeout (int): Mill 调用超时时间(秒)
+        workspace_dir (str, optional): 复用的工作区，为 None 时使用一次性临时目录
+        
+    Returns:
+        bool: 预热模块是否编译并阐述成功
+    """
+    code = TEMPLATE_COUNTER.format(module_name="WarmupCounter", width=4).strip()
+    try:
+        return reflect_batch([("WarmupCounter", code)], timeout=timeout, silent=True, workspace_dir=workspace_dir)[0] is True
+    except Exception:
         return False
 
-def worker_task(args):
-    """多进程工作函数"""
-    index, seed, log_file = args  # 解包增加 log_file
-    # 每个进程需要独立的随机种子
-    random.seed(seed)
+def golden_test(timeout=900):
+    """
+    Golden 测试: 启动时每类模板各生成一个样本，用一次 reflect_batch 统一验证。
+    结论按结构指纹预先填入验证缓存，只覆盖这些样本的结构; 同类模板的其它参数组合照常验证
+    (模板信任只由主循环中的真实验证累积)
     
+    Args:
+        timeout (int): Mill 调用超时时间(秒)
+        
+    Returns:
+        dict: 各样本的 {结构指纹: bool} (结论未知的样本不包含在内)
+    """
+    rng = random.Random(0)
+    samples = {}
+    for index in range(GOLDEN_MAX_DRAWS):
+        sample = generate_sample(index, rng)
+        samples.setdefault(sample["template"], sample)
+        if len(samples) == len(TEMPLATE_KINDS):
+            break
+    
+    candidates = [(sample["module_name"], sample["entry"]["output"]) for sample in samples.values()]
     try:
-        r = random.random()
-        # 更新课程分布: Level 1 (45%) | Level 2 (30%) | Level 2.5 util (10%) | Level 3 (15%)
-        # Level 2.5 专门训练 chisel3.util 相关的 API (PopCount, Reverse, Fill, Log2, etc.)
-        if r < 0.45:
-            sample = generate_level1(index)
-        elif r < 0.75:
-            sample = generate_level2(index)
-        elif r < 0.85:
-            sample = generate_level2_util(index)  # chisel3.util 专项训练
-        else:
-            sample = generate_level3(index)
-            
-        if validate_code(sample["entry"]["output"], sample["module_name"], index, log_file):
-            return sample["entry"]
-        return None
-    except Exception as e:
-        # 捕获并记录生成阶段的异常
-        log_error(log_file, index, "UNKNOWN", f"Generation Exception: {str(e)}")
-        return None
+        passed = reflect_batch(candidates, timeout=timeout, silent=True)
+    except Exception:
+        return {}
+    
+    # 只收录确定的结论，结论未知 (Mill 超时等) 的样本不计入
+    verdicts = {
+        shape_key(sample["entry"]["output"], sample["module_name"], sample.get("tags", ())): ok
+        for sample, ok in zip(samples.values(), passed) if ok is not None
+    }
+    return verdicts
+
+def writer_loop(entries, output_file):
+    """
+    后台写线程: 从队列取出 entry 编码并写入 JSONL，收到 None 时 fsync 并关闭文件退出。
+    编码与写盘与主循环等待验证结果重叠进行; 每当队列排空就 flush 一次，
+    进程崩溃时已取出的样本都已落盘
+    """
+    # 1 MiB 写缓冲: 把大量单行写入合并成少量系统调用
+    with open(output_file, "wb", buffering=1 << 20) as f:
+        while True:
+            entry = entries.get()
+            if entry is None:
+                break
+            f.write(dumps_line(entry))
+            if entries.empty():
+                f.flush()
+        # 结束时落盘一次，确保数据集文件在脚本退出后完整可用
+        f.flush()
+        os.fsync(f.fileno())
+
+def bounded_tasks(tasks, slots, stop):
+    """
+    给任务流加背压: 每交出一个任务先占一个名额，主进程每收到一个结果归还一个。
+    Pool 的任务分发线程会尽快耗尽输入迭代器，限流后在途任务数有上限，
+    达到目标时待丢弃的任务少。stop 置位后停止交出任务，分发线程可及时退出
+    """
+    for task in tasks:
+        while not slots.acquire(timeout=0.5):
+            if stop.is_set():
+                return
+        if stop.is_set():
+            return
+        yield task
 
 def main():
     # 初始化错误日志
     init_error_log()
     print(f"📝 错误日志文件: {ERROR_LOG_FILE}")
     
-    try:
-        if hasattr(sys.stdout, 'reconfigure'):
-            sys.stdout.reconfigure(line_buffering=True)  # type: ignore
-            sys.stderr.reconfigure(line_buffering=True)  # type: ignore
-    except (AttributeError, TypeError):
-        # 如果 reconfigure 不可用，忽略错误
-        pass
-    
-    # 默认生成 100 条用于测试，实际使用时可改为 10000
-    TARGET_COUNT = 100
-    if len(sys.argv) > 1:
+    # 只有输出到终端时才逐行刷新; 重定向到文件/管道 (nohup、tee、CI) 时保持块缓冲，减少 write 系统调用
+    for stream in (sys.stdout, sys.stderr):
         try:
-            TARGET_COUNT = int(sys.argv[1])
-        except:
+            if stream.isatty():
+                stream.reconfigure(line_buffering=True)  # type: ignore
+        except (AttributeError, TypeError):
+            # 如果 reconfigure 不可用，忽略错误
             pass
-            
+    
     # 自动检测 CPU 核心数
     # 优化策略: 
     # 1. sbt/JVM 非常吃内存，并行度过高会导致内存溢出或 Swap，反而变慢
     # 2. 编译是 CPU 密集型，保留一半核心给系统和其他进程响应
-    cpu_count = os.cpu_count() or 4
-    # 默认使用一半的核心，且至少为 1
-    default_workers = max(1, cpu_count // 2)
+    # (按亲和性与容器 CPU 配额计算，而不是宿主机的总核数)
+    cpu_count = available_cpus()
+    # 3. 按物理内存再限制一次: 核多内存少的机器上按核数开 worker 会把 JVM 挤进 Swap
+    total_mb = psutil.virtual_memory().total // (1024 * 1024)
+    mem_workers = max(1, int(total_mb * MEMORY_BUDGET_FRACTION) // PER_WORKER_MB)
+    # 默认使用一半的核心 (至少为 1)，且不超过内存上限
+    cpu_workers = max(1, cpu_count // 2)
+    default_workers = min(cpu_workers, mem_workers)
     
-    # 允许通过命令行参数指定 worker 数量: python generator.py [count] [workers]
-    num_processes = default_workers
-    if len(sys.argv) > 2:
-        try:
-            num_processes = int(sys.argv[2])
-        except:
-            pass
+    # 命令行: python generator_V2.py [count] [workers] [--maxtasks N] [--shape-quota N] [--golden]
+    parser = argparse.ArgumentParser(description="ChiseLLM 合成数据生成器 V2")
+    # 默认生成 100 条用于测试，实际使用时可改为 10000
+    parser.add_argument("count", type=int, nargs="?", default=100,
+                        help="目标有效样本数")
+    parser.add_argument("workers", type=int, nargs="?", default=default_workers,
+                        help=f"worker 进程数 (默认: CPU 核心数的一半，且不超过内存上限 {mem_workers})")
+    parser.add_argument("--maxtasks", type=int, default=DEFAULT_MAXTASKS_PER_CHILD,
+                        help=f"每个 worker 处理多少批任务后重建 (默认: {DEFAULT_MAXTASKS_PER_CHILD}，0 表示不重建)")
+    parser.add_argument("--shape-quota", type=int, default=0,
+                        help="每种结构 (只差名字的样本) 最多收录多少条，用于提高结构多样性 (默认: 0，不限制)")
+    parser.add_argument("--golden", action="store_true",
+                        help="启动时对每类模板做一次 golden 测试，结论预先填入结构验证缓存")
+    args = parser.parse_args()
     
-    print(f"🚀 启动 Chisel 合成数据引擎 V3 (Target: {TARGET_COUNT})", flush=True)
-    print(f"⚡ 启用多进程加速: {num_processes} workers", flush=True)
-    print("📊 课程分布: Level 1 (45%) | Level 2 (30%) | Level 2.5 util (10%) | Level 3 (15%)", flush=True)
-    print("✨ V3 新特性: chisel3.util 专项训练 | Cat/Enum/PopCount | FSM 状态机 | 错误日志", flush=True)
-    print("⏳ 正在初始化并行工作进程 (JVM 预热可能需要几十秒，期间进度条可能不会更新，请耐心等待)...", flush=True)
+    TARGET_COUNT = args.count
+    num_processes = max(1, args.workers)
+    maxtasks = args.maxtasks if args.maxtasks > 0 else None
+    shape_quota = max(0, args.shape_quota)
     
-    valid_dataset = []
+    print(f"🚀 启动 Chisel 合成数据引擎 V3 (Target: {TARGET_COUNT})")
+    print(f"⚡ 启用多进程加速: {num_processes} workers (每 {maxtasks or '∞'} 批任务重建 worker)")
+    print(f"🧮 worker 上限: CPU {cpu_workers} | 内存 {mem_workers} "
+          f"({total_mb} MB × {MEMORY_BUDGET_FRACTION:.0%} / {PER_WORKER_MB} MB)，可用 workers 参数覆盖")
+    print("📊 课程分布: Level 1 (45%) | Level 2 (30%) | Level 2.5 util (10%) | Level 3 (15%)")
+    print("✨ V3 新特性: chisel3.util 专项训练 | Cat/Enum/PopCount | FSM 状态机 | 错误日志")
+    print("⏳ 正在初始化并行工作进程 (JVM 预热可能需要几十秒，期间进度条可能不会更新，请耐心等待)...")
     
-    # 关键修复: 使用 dynamic_ncols=True 适配终端, mininterval=0.5 提高刷新率
-    pbar = tqdm(total=TARGET_COUNT, miniters=1, dynamic_ncols=True, mininterval=0.5)
+    # 输出文件在生成开始前打开，有效样本边生成边写入
+    output_dir = os.path.join(parent_dir, "dataset")
+    os.makedirs(output_dir, exist_ok=True)
+    # 使用带版本号的文件名
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_file = os.path.join(output_dir, f"chisel_sft_dataset_v2_{timestamp}.jsonl")
+    # 写盘交给后台线程，主循环只负责入队
+    write_queue = queue.Queue()
+    writer = threading.Thread(target=writer_loop, args=(write_queue, output_file), daemon=True)
+    writer.start()
+    valid_count = 0
+    # 各结构已收录的样本数 (仅在设置了 --shape-quota 时用于拒收超额的重复结构)
+    shape_counts = Counter()
+    quota_rejected = 0
+    
+    # 载入历史结构验证结论，结构重复的样本不再重新阐述
+    shape_cache = load_validation_cache()
+    new_shapes = {}
+    print(f"🗂️ 已载入 {len(shape_cache)} 条历史验证结论")
+    
+    print("🔥 预热 Mill/Chisel 依赖缓存...")
+    warmup_start = time.perf_counter()
+    if warmup():
+        print(f"✅ 预热完成 ({time.perf_counter() - warmup_start:.1f}s)")
+    else:
+        print("⚠️ 预热模块验证失败，请检查 Mill/Chisel 环境 (继续运行)")
+    
+    if args.golden:
+        print(f"🥇 Golden 测试 {len(TEMPLATE_KINDS)} 类模板...")
+        golden_verdicts = golden_test()
+        shape_cache.update(golden_verdicts)
+        new_shapes.update(golden_verdicts)
+        print(f"✅ Golden 测试通过 {sum(golden_verdicts.values())}/{len(TEMPLATE_KINDS)} 类模板")
+    
+    # 关键修复: 使用 dynamic_ncols=True 适配终端, mininterval=0.5 提高刷新率，
+    # maxinterval=2.0 保证结果稀疏时也至少每 2 秒重绘一次
+    pbar = tqdm(total=TARGET_COUNT, miniters=1, dynamic_ncols=True, mininterval=0.5, maxinterval=2.0)
     
     # 创建进程池
-    print(f"🔧 创建进程池 (workers={num_processes})...", flush=True)
-    pool = multiprocessing.Pool(processes=num_processes)
-    print(f"✅ 进程池已创建", flush=True)
+    print(f"🔧 创建进程池 (workers={num_processes})...")
+    # fork 出的 worker 会继承尚未写出的缓冲内容，创建进程池前先清空，避免重复输出
+    sys.stdout.flush()
+    workspace_root = tempfile.mkdtemp(prefix="chisel_ws_")
+    # 本次运行的 64 位基准种子取自操作系统熵源，各 worker 据此派生自己的随机流
+    base_seed = int.from_bytes(os.urandom(8), "little")
+    # Linux 上显式使用 fork: 模板与指令池等模块级常量在 fork 前已就绪，worker 以写时复制共享;
+    # gc.freeze() 把现有对象移出 GC 追踪，避免子进程 GC 扫描时改写引用信息而触发页复制。
+    # 其它平台优先用 forkserver: 它默认预加载 __main__，本脚本及 reflect_env 只在 forkserver 进程里导入一次，
+    # 之后的 worker (包括 maxtasksperchild 回收后重建的) 都从它 fork 出来; 不支持时退回 spawn。
+    # 两种方式下 init_worker 照常执行
+    start_methods = multiprocessing.get_all_start_methods()
+    if "fork" in start_methods and sys.platform.startswith("linux"):
+        mp_context = multiprocessing.get_context("fork")
+        gc.freeze()
+    elif "forkserver" in start_methods:
+        mp_context = multiprocessing.get_context("forkserver")
+    else:
+        mp_context = multiprocessing.get_context("spawn")
+    # 错误日志经队列汇总到主进程的日志线程，worker 不直接写文件
+    log_queue = mp_context.Queue()
+    logger_stop = threading.Event()
+    logger = threading.Thread(target=logger_loop, args=(log_queue, ERROR_LOG_FILE, logger_stop), daemon=True)
+    logger.start()
+    # 各模板类别的连续通过次数，所有 worker 共享
+    trust_streaks = mp_context.Array("i", len(TEMPLATE_KINDS))
+    pool = mp_context.Pool(
+        processes=num_processes,
+        initializer=init_worker,
+        initargs=(workspace_root, shape_cache, base_seed, log_queue, trust_streaks),
+        maxtasksperchild=maxtasks
+    )
+    print(f"✅ 进程池已创建")
+    
+    # 任务流: 无限的批次生成器，按需产出直到收满 TARGET_COUNT 条有效样本为止，
+    # 不再预先按固定冗余倍数分配任务; 配合下方的在途上限，超额派发只限于在途批次。
+    # 每个任务在 worker 内生成一批样本并由一个 JVM 统一验证，
+    # 批大小不超过 VALIDATE_BATCH_SIZE，且保证每个 worker 至少分到一批
+    batch_size = max(1, min(VALIDATE_BATCH_SIZE, -(-TARGET_COUNT // num_processes)))
+    num_batches = -(-TARGET_COUNT // batch_size)
+    tasks = (range(start, start + batch_size) for start in itertools.count(0, batch_size))
+    # 通过率异常低 (如 Mill/Chisel 环境损坏) 时的兜底: 尝试数达到目标的若干倍后放弃
+    max_attempts = TARGET_COUNT * MAX_ATTEMPTS_FACTOR
     
-    # 提交任务：根据经验，模板生成的代码通过率很高 (>90%)
-    # 设置 1.5 倍冗余即可，避免生成过多的任务列表
-    redundancy_factor = 1.5
-    total_tasks = int(TARGET_COUNT * redundancy_factor)
-    tasks = [(i, random.randint(0, 1000000000), ERROR_LOG_FILE) for i in range(total_tasks)]
+    # 每个 worker 约分到 8 次派发: 任务很多时合并派发以减少调度唤醒与 IPC 往返。
+    # 取舍: chunk 越大，达到目标时已派发、需丢弃的批次越多 (至多约
+    # 2 × chunksize × num_processes 批，见下方在途上限)，8 次派发使这部分浪费控制在目标量的 1/4 左右，
+    # 同时保留足够的粒度让快慢 worker 之间做负载均衡
+    chunksize = max(1, num_batches // (num_processes * 8))
+    
+    # 在途任务上限: 每个 worker 两次派发的量，保证分发线程不会因凑不满一个 chunk 而卡住
+    slots = threading.Semaphore(2 * chunksize * num_processes)
+    stop = threading.Event()
     
     attempts = 0
     try:
-        # chunksize=1 确保结果一出来就更新，而不是攒一批
-        for result in pool.imap_unordered(worker_task, tasks, chunksize=1):
-            attempts += 1
-            if result:
-                valid_dataset.append(result)
-                pbar.update(1)
+        for results, new_verdicts in pool.imap_unordered(worker_task, bounded_tasks(tasks, slots, stop), chunksize=chunksize):
+            slots.release()
+            new_shapes.update(new_verdicts)
+            accepted = 0
+            for result in results:
+                attempts += 1
+                if result and valid_count < TARGET_COUNT:
+                    key, entry = result
+                    if shape_quota:
+                        if shape_counts[key] >= shape_quota:
+                            quota_rejected += 1
+                            continue
+                        shape_counts[key] += 1
+                    write_queue.put(entry)
+                    valid_count += 1
+                    accepted += 1
             
-            # 实时更新状态：显示尝试次数和当前通过率
+            # 每批只更新一次状态 (尝试次数和当前通过率)。postfix 不单独触发重绘，
+            # 随 update() 在 mininterval/maxinterval 节奏下一起刷新
             pbar.set_postfix({
                 "attempts": attempts, 
-                "rate": f"{len(valid_dataset)/attempts:.1%}"
-            })
+                "rate": f"{valid_count/attempts:.1%}"
+            }, refresh=False)
+            pbar.update(accepted)
                 
-            if len(valid_dataset) >= TARGET_COUNT:
-                # 达到目标后立即终止进程池，避免等待剩余任务
+            if valid_count >= TARGET_COUNT:
+                # 达到目标后停止派发并立即终止进程池，避免等待剩余任务
+                stop.set()
                 pool.terminate()
                 break
+            if attempts >= max_attempts:
+                print(f"\n⚠️ 已尝试 {attempts} 次仍未达到目标，通过率过低或结构配额已用尽，提前结束 (详见错误日志)")
+                break
     except KeyboardInterrupt:
-        print("\n⚠️ 用户中断，正在保存已生成的数据...")
+        print("\n⚠️ 用户中断，已生成的数据已写入输出文件")
+        stop.set()
         pool.terminate()
     finally:
+        # 任务全部跑完而未达到目标时进程池仍在运行，统一先终止再等待
+        stop.set()
+        pool.terminate()
         pool.join()  # 等待所有子进程真正退出（释放资源）
         pbar.close()
+        # 发送结束标记并等待写线程把队列中剩余样本写完
+        write_queue.put(None)
+        writer.join()
+        # 停止日志线程: 半条记录会让读取一直阻塞，因此限时等待，超时则放弃 (守护线程随进程退出)
+        logger_stop.set()
+        logger.join(timeout=LOGGER_JOIN_TIMEOUT)
+        # 关闭各 worker 工作区的 Mill server 并清理目录
+        for name in os.listdir(workspace_root):
+            close_workspace(os.path.join(workspace_root, name))
+        shutil.rmtree(workspace_root, ignore_errors=True)
+        save_validation_cache(new_shapes)
     
-    output_dir = os.path.join(parent_dir, "dataset")
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # 使用带版本号的文件名
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_file = os.path.join(output_dir, f"chisel_sft_dataset_v2_{timestamp}.jsonl")
-    
-    with open(output_file, "w", encoding="utf-8") as f:
-        for entry in valid_dataset:
-            f.write(json.dumps(entry) + "\n")
-            
     print(f"✅ 数据集生成完毕: {output_file}")
-    print(f"📦 总有效样本数: {len(valid_dataset)}")
+    print(f"📦 总有效样本数: {valid_count}")
     print(f"📊 总尝试次数: {attempts}")
-    print(f"🎯 通过率: {len(valid_dataset)/attempts:.2%}" if attempts > 0 else "N/A")
+    print(f"🎯 通过率: {valid_count/attempts:.2%}" if attempts > 0 else "N/A")
+    if shape_quota:
+        print(f"🧩 结构配额: 每种结构至多 {shape_quota} 条，共 {len(shape_counts)} 种结构，拒收 {quota_rejected} 条重复")
     print(f"📝 错误日志: {ERROR_LOG_FILE}")
 
 if __name__ == "__main__":
@@ -10,10 +10,13 @@
 
 import sys
 import os
-import json
 import glob
+import random
+import shutil
 from datetime import datetime
 
+from gen_core import loads_line, dumps_line
+
 def find_latest_supplement():
     """查找最新的补充数据集"""
     pattern = "dataset/chisel_util_supplement_*.jsonl"
@@ -22,6 +25,26 @@ def find_latest_supplement():
         return None
     return max(files, key=os.path.getctime)
 
+# chisel3.util 覆盖统计的关键字 (统计名 -> 在 output 中查找的子串)
+UTIL_MARKERS = {
+    "util": "import chisel3.util",
+    "enum": "Enum(",
+    "popcount": "PopCount",
+}
+
+def read_samples(path, stats):
+    """读取 JSONL 数据集，读取的同时累计 chisel3.util 覆盖统计 (每条记录只解析一次)"""
+    samples = []
+    with open(path, 'rb') as f:
+        for line in f:
+            sample = loads_line(line)
+            output = sample.get('output', '')
+            for name, marker in UTIL_MARKERS.items():
+                if marker in output:
+                    stats[name] += 1
+            samples.append(sample)
+    return samples
+
 def main():
     # 路径配置
     base_dataset = "dataset/chisel_sft_dataset_v2_20251124_081913.jsonl"
@@ -47,42 +70,27 @@ def main():
     
     # 读取基础数据集
     print("\n📖 读取基础数据集...")
-    base_samples = []
-    with open(base_dataset, 'r', encoding='utf-8') as f:
-        for line in f:
-            base_samples.append(json.loads(line))
+    stats = dict.fromkeys(UTIL_MARKERS, 0)
+    base_samples = read_samples(base_dataset, stats)
     print(f"  ✅ 基础样本: {len(base_samples)}")
     
     # 读取补充数据集
     print("\n📖 读取补充数据集...")
-    supplement_samples = []
-    with open(supplement_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            supplement_samples.append(json.loads(line))
+    supplement_samples = read_samples(supplement_file, stats)
     print(f"  ✅ 补充样本: {len(supplement_samples)}")
     
     # 合并
     all_samples = base_samples + supplement_samples
     print(f"\n📦 合并后总样本: {len(all_samples)}")
     
-    # 打乱顺序（可选，有助于训练）
-    import random
-    random.seed(42)
-    random.shuffle(all_samples)
+    # 打乱顺序（可选，有助于训练）; 使用独立的 Random 实例，不改动全局 random 状态
+    random.Random(42).shuffle(all_samples)
     print("  ✅ 已打乱顺序")
     
-    # 统计 chisel3.util 覆盖
-    util_count = 0
-    enum_count = 0
-    popcount_count = 0
-    for sample in all_samples:
-        output = sample.get('output', '')
-        if 'import chisel3.util' in output:
-            util_count += 1
-        if 'Enum(' in output:
-            enum_count += 1
-        if 'PopCount' in output:
-            popcount_count += 1
+    # chisel3.util 覆盖统计 (已在读取时累计)
+    util_count = stats["util"]
+    enum_count = stats["enum"]
+    popcount_count = stats["popcount"]
     
     print(f"\n📊 chisel3.util 统计:")
     print(f"  - import chisel3.util: {util_count} ({util_count/len(all_samples)*100:.1f}%)")
@@ -93,16 +101,14 @@ def main():
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     backup_file = f"dataset/chisel_sft_merged_{timestamp}.jsonl"
     
+    # 全部样本只序列化一次，用一次 write 写入备份
     print(f"\n💾 保存本地备份: {backup_file}")
-    with open(backup_file, 'w', encoding='utf-8') as f:
-        for sample in all_samples:
-            f.write(json.dumps(sample, ensure_ascii=False) + '\n')
+    with open(backup_file, 'wb') as f:
+        f.write(b"".join(dumps_line(sample) for sample in all_samples))
     
-    # 复制到 LLaMA-Factory
+    # 复制到 LLaMA-Factory (直接复制备份文件，不再重新序列化)
     print(f"\n🚀 复制到 LLaMA-Factory: {llama_factory_data}")
-    with open(llama_factory_data, 'w', encoding='utf-8') as f:
-        for sample in all_samples:
-            f.write(json.dumps(sample, ensure_ascii=False) + '\n')
+    shutil.copyfile(backup_file, llama_factory_data)
     
     print("\n" + "=" * 60)
     print("✅ 数据准备完成！")
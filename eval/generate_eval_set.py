@@ -17,9 +17,13 @@ import os
 import sys
 import re
 import random
+import shutil
+import tempfile
 import multiprocessing
 from datetime import datetime
-from typing import List, Dict, Any, Optional, Tuple
+from functools import lru_cache
+from string import Formatter
+from typing import List, Dict, Any, Optional, Tuple, Callable
 
 # 尝试导入 tqdm，如果不可用则提供简单替代
 try:
@@ -51,10 +55,14 @@ sys.path.insert(0, src_dir)
 # 尝试导入反射环境
 REFLECT_AVAILABLE = False
 reflect = None  # type: ignore  # 显式声明，避免"可能未绑定"警告
+reflect_batch = None  # type: ignore
+close_workspace = None  # type: ignore
 
 try:
-    from reflect_env import reflect as _reflect  # type: ignore
+    from reflect_env import reflect as _reflect, reflect_batch as _reflect_batch, close_workspace as _close_workspace  # type: ignore
     reflect = _reflect
+    reflect_batch = _reflect_batch
+    close_workspace = _close_workspace
     REFLECT_AVAILABLE = True
 except ImportError:
     print("⚠️ 警告: 无法导入 reflect_env，将跳过验证")
@@ -457,55 +465,96 @@ class ValidReg{name} extends Module {{
 # 验证函数
 # ============================================================================
 
-def validate_code(code: str, module_name: str, case_id: str, log_file: str) -> bool:
+# 每次批量阐述 (一次 Mill 调用) 的最大用例数
+EVAL_BATCH_SIZE = 32
+
+# 当前进程独占的 Mill 工作区 (由 init_worker 创建)，各次验证复用同一个常驻 Mill server (JVM)
+_WORKSPACE: Optional[str] = None
+
+
+def init_worker(workspace_root: str) -> None:
+    """验证进程初始化: 在 workspace_root 下创建本进程的持久工作区"""
+    global _WORKSPACE
+    _WORKSPACE = tempfile.mkdtemp(prefix="worker_", dir=workspace_root)
+
+
+def close_workspaces(workspace_root: str) -> None:
+    """关闭 workspace_root 下各进程工作区的 Mill server 并删除目录"""
+    if close_workspace is not None:
+        for name in os.listdir(workspace_root):
+            close_workspace(os.path.join(workspace_root, name))
+    shutil.rmtree(workspace_root, ignore_errors=True)
+
+
+def make_batches(cases: List[Dict[str, Any]], batch_size: int) -> List[List[Dict[str, Any]]]:
+    """按顺序把用例分批，同一批内模块名互不相同 (reflect_batch 的要求)"""
+    batches: List[List[Dict[str, Any]]] = []
+    for case in cases:
+        module_name = case["test_config"]["module_name"]
+        for batch in batches:
+            if len(batch) < batch_size and all(c["test_config"]["module_name"] != module_name for c in batch):
+                batch.append(case)
+                break
+        else:
+            batches.append([case])
+    return batches
+
+
+def validate_batch_worker(args: Tuple) -> List[Dict[str, Any]]:
     """
-    使用反射环境验证代码
+    验证工作函数: 一批用例在一次 Mill 调用 (一个 JVM) 中编译并阐述
     
     Returns:
-        True 如果编译和阐述都通过
+        通过验证的用例 (保持原顺序)
     """
-    if not REFLECT_AVAILABLE or reflect is None:
-        return True  # 跳过验证
+    cases, log_file = args
+    if not REFLECT_AVAILABLE or reflect_batch is None:
+        return cases  # 跳过验证
     
+    candidates = [(case["test_config"]["module_name"], case["reference_code"]) for case in cases]
     try:
-        result = reflect(
-            chisel_code_string=code,
-            module_name=module_name,
-            testbench_path=None,
-            output_dir=None,
-            verilog_file=None,
-            result_file=None,
-            silent=True
-        )
-        
-        if result['compiled'] and result['elaborated']:
-            return True
-        else:
-            error_stage = "compilation" if not result['compiled'] else "elaboration"
-            error_info = f"Stage: {error_stage}\n"
-            if 'error_log' in result:
-                error_info += f"Error Log:\n{result['error_log']}\n"
-            error_info += f"\nCode:\n{code}\n"
-            log_error(log_file, case_id, module_name, error_info)
-            return False
-            
+        verdicts = reflect_batch(candidates, silent=True, workspace_dir=_WORKSPACE)
     except Exception as e:
-        error_info = f"Exception: {str(e)}\nCode:\n{code}\n"
-        log_error(log_file, case_id, module_name, error_info)
-        return False
+        for case in cases:
+            error_info = f"Exception: {str(e)}\nCode:\n{case['reference_code']}\n"
+            log_error(log_file, case["id"], case["test_config"]["module_name"], error_info)
+        return []
+    
+    valid = []
+    for case, ok in zip(cases, verdicts):
+        if ok:
+            valid.append(case)
+        else:
+            # 批量阐述只给出通过与否，需要详细日志时可对该用例单独调用 reflect()
+            stage = "compilation/elaboration (batch)" if ok is False else "unknown (batch timeout or infrastructure failure)"
+            error_info = f"Stage: {stage}\n\nCode:\n{case['reference_code']}\n"
+            log_error(log_file, case["id"], case["test_config"]["module_name"], error_info)
+    return valid
 
 
-def validate_case_worker(args: Tuple) -> Optional[Dict[str, Any]]:
-    """多进程验证工作函数"""
-    case, log_file = args
+# ============================================================================
+# 模板预编译
+# ============================================================================
+
+@lru_cache(maxsize=None)
+def compile_template(template: str) -> Callable[..., str]:
+    """
+    将 str.format 模板预先解析为 (字面量, 字段名) 片段，返回渲染函数。
+    每个模板只解析一次，之后渲染各变体只需查字典和拼接，结果与 template.format(**kw) 一致
+    """
+    parts: List[Tuple[str, Optional[str]]] = []
+    for literal, field, spec, conversion in Formatter().parse(template):
+        if field is not None and (spec or conversion or not field.isidentifier()):
+            raise ValueError(f"模板只支持简单占位符 {{name}}: {{{field}}}")
+        parts.append((literal, field))
     
-    code = case["reference_code"]
-    module_name = case["test_config"]["module_name"]
-    case_id = case["id"]
+    def render(**kw: Any) -> str:
+        return "".join(
+            literal + (str(kw[field]) if field is not None else "")
+            for literal, field in parts
+        )
     
-    if validate_code(code, module_name, case_id, log_file):
-        return case
-    return None
+    return render
 
 
 # ============================================================================
@@ -519,11 +568,13 @@ def generate_test_cases(templates: List[Dict], level: str, start_id: int) -> Lis
     
     for template in templates:
         category = template["category"]
+        render_instruction = compile_template(template["instruction_template"])
+        render_reference = compile_template(template["reference_template"])
         
         for variant in template["variants"]:
             # 格式化指令和参考代码
-            instruction = template["instruction_template"].format(**variant)
-            reference = template["reference_template"].format(**variant)
+            instruction = render_instruction(**variant)
+            reference = render_reference(**variant)
             
             # 提取模块名
             match = re.search(r'class\s+(\w+)', reference)
@@ -606,22 +657,28 @@ def generate_eval_set(
         print(f"📝 错误日志: {log_file}")
         print("正在验证参考代码...")
         
-        if num_workers == 1:
-            # 串行验证
-            for case in tqdm(all_cases, desc="验证"):
-                result = validate_case_worker((case, log_file))
-                if result:
-                    valid_cases.append(result)
-        else:
-            # 并行验证
-            work_items = [(case, log_file) for case in all_cases]
-            with multiprocessing.Pool(num_workers) as pool:
-                results = list(tqdm(
-                    pool.imap(validate_case_worker, work_items),
-                    total=len(work_items),
-                    desc=f"验证 ({num_workers} workers)"
-                ))
-            valid_cases = [r for r in results if r is not None]
+        # 每个验证进程一个持久工作区: JVM 只在首个用例冷启动一次，之后的用例复用
+        workspace_root = tempfile.mkdtemp(prefix="chisel_eval_ws_")
+        try:
+            # 分批: 每批一次 Mill 调用；用例较少时减小批大小，保证每个进程都分到批次
+            batch_size = max(1, min(EVAL_BATCH_SIZE, -(-len(all_cases) // num_workers)))
+            work_items = [(batch, log_file) for batch in make_batches(all_cases, batch_size)]
+            if num_workers == 1:
+                # 串行验证
+                init_worker(workspace_root)
+                for item in tqdm(work_items, desc="验证 (批)"):
+                    valid_cases.extend(validate_batch_worker(item))
+            else:
+                # 并行验证
+                with multiprocessing.Pool(num_workers, initializer=init_worker, initargs=(workspace_root,)) as pool:
+                    for valid in tqdm(
+                        pool.imap(validate_batch_worker, work_items),
+                        total=len(work_items),
+                        desc=f"验证 (批, {num_workers} workers)"
+                    ):
+                        valid_cases.extend(valid)
+        finally:
+            close_workspaces(workspace_root)
     else:
         valid_cases = all_cases
         if verify and not REFLECT_AVAILABLE:
@@ -182,7 +182,7 @@ class ChiselAgent:
 2. VCD 波形文件命名为 waveform.vcd
 3. 使用 std::endl 进行换行
 4. 包含复位逻辑和基本测试
-5. 输出 TEST PASSED 或 TEST FAILED
+5. 输出 TEST PASSED 或 TEST FAILED，并以退出码表示结果 (通过 return 0，失败 return 1)
 
 请将代码包含在 ```cpp ... ``` 代码块中。
 """
@@ -32,11 +32,67 @@ import os
 import shutil
 import json
 import re
+import hashlib
+import time
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 
 
+# Mill 构建配置模板 (fork_args 为 chiselmodule.run 启动的阐述 JVM 的参数)
+MILL_BUILD_SC_TEMPLATE = """import mill._
+import mill.scalalib._
+
+object chiselmodule extends ScalaModule {{
+  def scalaVersion = "2.13.12"
+  
+  def ivyDeps = Agg(
+    ivy"org.chipsalliance::chisel:6.0.0"
+  )
+  
+  def scalacOptions = Seq(
+    "-Xsource:2.13",
+    "-language:reflectiveCalls",
+    "-deprecation",
+    "-feature",
+    "-Xcheckinit"
+  )
+  
+  def scalacPluginIvyDeps = Agg(
+    ivy"org.chipsalliance:::chisel-plugin:6.0.0"
+  )
+  
+  def forkArgs = Seq({fork_args})
+}}
+"""
+
+# 阐述 JVM 参数: 短命 JVM 用吞吐优先的 ParallelGC，预留足够堆避免阐述中途扩堆，
+# 加大线程栈以容纳 Chisel/FIRRTL 的深递归
+ELABORATION_JVM_OPTS = ("-XX:+UseParallelGC", "-Xss8m", "-Xms1g", "-Xmx2g")
+
+# AppCDS: 首次运行退出时把加载过的类元数据转储到工作区内的归档，之后的 JVM 直接映射
+# 该归档，免去 Scala/Chisel/CIRCT 绑定类的重复解析。需要 JDK 19+
+# (-XX:+AutoCreateSharedArchive)，更老的 JDK 忽略这些参数并正常启动
+ELABORATION_CDS_OPTS = (
+    "-XX:+IgnoreUnrecognizedVMOptions",
+    "-XX:+AutoCreateSharedArchive",
+    "-XX:SharedArchiveFile=chiselmodule.jsa",
+)
+
+
+def _format_build_sc(jvm_opts) -> str:
+    """用给定的阐述 JVM 参数生成 build.sc 内容"""
+    return MILL_BUILD_SC_TEMPLATE.format(fork_args=", ".join(f'"{opt}"' for opt in jvm_opts))
+
+
+# 一次性临时目录使用的构建配置 (不生成 CDS 归档)
+MILL_BUILD_SC = _format_build_sc(ELABORATION_JVM_OPTS)
+
+# 持久工作区 (reflect_batch，以及传入 workspace_dir 的 reflect) 使用的构建配置:
+# 工作区内的归档可被后续各次调用复用
+MILL_BATCH_BUILD_SC = _format_build_sc(ELABORATION_JVM_OPTS + ELABORATION_CDS_OPTS)
+
+
 def _log(message: str, silent: bool = False):
     """辅助函数: 条件性打印日志"""
     if not silent:
@@ -50,7 +106,8 @@ def reflect(
     output_dir: Optional[str] = None,
     verilog_file: Optional[str] = None,
     result_file: Optional[str] = None,
-    silent: bool = False  # 新增: 静默模式开关
+    silent: bool = False,  # 新增: 静默模式开关
+    workspace_dir: Optional[str] = None
 ) -> dict:
     """
     反射函数: 接收 Chisel/Scala 代码字符串, 返回包含"体检报告"的字典。
@@ -63,6 +120,9 @@ def reflect(
         verilog_file (str, optional): Verilog 输出文件名(默认: "related_Verilog.v")
         result_file (str, optional): 结果 JSON 文件名(默认: "result.json")
         silent (bool, optional): 是否启用静默模式(不打印进度信息)。默认 False
+        workspace_dir (str, optional): 复用的 Mill 工作区目录。与 reflect_batch 相同，同一工作区
+            常驻一个 Mill 后台 server (JVM) 并保留增量编译结果，反复调用时免去 JVM 冷启动;
+            用完后调用 close_workspace() 关闭。为 None 时使用一次性临时目录
         
     Returns:
         dict: 体检报告,包含以下字段:
@@ -71,8 +131,8 @@ def reflect(
             - sim_passed (bool/None): 仿真测试是否通过(None 表示未测试)
             - error_log (str): 错误日志 (如果有)
             - generated_verilog (str): 生成的 Verilog 代码 (如果成功)
-            - full_stdout (str): 完整的标准输出
-            - full_stderr (str): 完整的标准错误输出
+            - full_stdout (str): Mill 标准输出的末尾部分 (仅失败时)
+            - full_stderr (str): Mill 标准错误输出的末尾部分 (仅失败时)
             - stage (str): 当前阶段 ("compilation", "elaboration", "simulation", "passed", "exception")
             - timestamp (str): 测试时间戳
             - module_name (str): 模块名称
@@ -92,63 +152,102 @@ def reflect(
         "module_name": module_name
     }
     
-    # 创建临时工作目录
-    with tempfile.TemporaryDirectory() as temp_dir:
-        try:
-            # --- 步骤 1: 编译与阐述 ---
-            verilog_file_path = run_compile_and_elaborate(
-                temp_dir, chisel_code_string, module_name, result, silent
-            )
-            
-            # 如果编译或阐述失败,提前返回
-            if not verilog_file_path:
-                # 保存结果到输出目录(如果指定)
-                if output_dir:
-                    result_path = _save_results(result, output_dir, result_file)
-                    _log(f"✗ 失败于阶段: {result['stage']}", silent)
-                    _log(f"✓ 日志已保存到: {result_path}", silent)
-                return result
-            
-            # 如果成功阐述,保存 Verilog 文件
-            if output_dir and result["elaborated"]:
-                verilog_path = _save_verilog(result["generated_verilog"], output_dir, verilog_file)
-                _log(f"✓ Verilog 已保存到: {verilog_path}", silent)
-            
-            # --- 步骤 2: 仿真 (可选) ---
-            # 只有提供了 testbench 才执行仿真
-            if testbench_path:
-                if not os.path.exists(testbench_path):
-                    result["error_log"] = f"Testbench file not found: {testbench_path}"
-                    result["stage"] = "simulation"
-                else:
-                    run_simulation(
-                        temp_dir,
-                        verilog_file_path,
-                        module_name,
-                        testbench_path,
-                        result,
-                        silent,
-                    )
-                    result["stage"] = "passed" if result["sim_passed"] else "simulation"
-            else:
-                # 没有 testbench,仿真阶段跳过
-                result["stage"] = "passed"
-                _log("ℹ 未提供 testbench,跳过仿真阶段", silent)
-            
-        except Exception as e:
-            result["error_log"] = f"Python Exception: {str(e)}"
-            result["stage"] = "exception"
+    if workspace_dir is None:
+        # 创建临时工作目录
+        with tempfile.TemporaryDirectory() as temp_dir:
+            _reflect_in(temp_dir, chisel_code_string, module_name, testbench_path,
+                        output_dir, verilog_file, result_file, silent, result)
+    else:
+        _prepare_workspace(workspace_dir)
+        _reflect_in(workspace_dir, chisel_code_string, module_name, testbench_path,
+                    output_dir, verilog_file, result_file, silent, result)
+    
+    return result
+
+
+def _reflect_in(
+    temp_dir: str,
+    chisel_code_string: str,
+    module_name: str,
+    testbench_path: Optional[str],
+    output_dir: Optional[str],
+    verilog_file: Optional[str],
+    result_file: Optional[str],
+    silent: bool,
+    result: dict
+) -> None:
+    """reflect 的实际执行部分 (在给定工作目录内编译、阐述并仿真，结果写入 result)"""
+    try:
+        # --- 步骤 1: 编译与阐述 ---
+        verilog_file_path = run_compile_and_elaborate(
+            temp_dir, chisel_code_string, module_name, result, silent
+        )
         
-        finally:
-            # 读取日志文件 (如果存在)
-            _read_logs(temp_dir, result)
-            
+        # 如果编译或阐述失败,提前返回
+        if not verilog_file_path:
             # 保存结果到输出目录(如果指定)
             if output_dir:
                 result_path = _save_results(result, output_dir, result_file)
-                _log(f"✓ 测试报告已保存到: {result_path}", silent)
+                _log(f"✗ 失败于阶段: {result['stage']}", silent)
+                _log(f"✓ 日志已保存到: {result_path}", silent)
+            return
+        
+        # 如果成功阐述,保存 Verilog 文件
+        if output_dir and result["elaborated"]:
+            verilog_path = _save_verilog(result["generated_verilog"], output_dir, verilog_file)
+            _log(f"✓ Verilog 已保存到: {verilog_path}", silent)
+        
+        # --- 步骤 2: 仿真 (可选) ---
+        # 只有提供了 testbench 才执行仿真
+        if testbench_path:
+            if not os.path.exists(testbench_path):
+                result["error_log"] = f"Testbench file not found: {testbench_path}"
+                result["stage"] = "simulation"
+            else:
+                run_simulation(
+                    temp_dir,
+                    verilog_file_path,
+                    module_name,
+                    testbench_path,
+                    result,
+                    silent,
+                )
+                result["stage"] = "passed" if result["sim_passed"] else "simulation"
+        else:
+            # 没有 testbench,仿真阶段跳过
+            result["stage"] = "passed"
+            _log("ℹ 未提供 testbench,跳过仿真阶段", silent)
+        
+    except Exception as e:
+        result["error_log"] = f"Python Exception: {str(e)}"
+        result["stage"] = "exception"
     
-    return result
+    finally:
+        # 失败时读取日志文件末尾 (如果存在)，成功时不附带日志
+        if result["stage"] != "passed":
+            _read_logs(temp_dir, result)
+        
+        # 保存结果到输出目录(如果指定)
+        if output_dir:
+            result_path = _save_results(result, output_dir, result_file)
+            _log(f"✓ 测试报告已保存到: {result_path}", silent)
+
+
+def _prepare_workspace(workspace_dir: str) -> None:
+    """
+    准备复用的 reflect 工作区: 清理上一次调用留下的源文件、Verilog、仿真产物和日志,
+    保留 build.sc 与 out/ (Mill 增量编译和依赖解析结果)
+    """
+    os.makedirs(workspace_dir, exist_ok=True)
+    build_sc_path = os.path.join(workspace_dir, "build.sc")
+    if not os.path.exists(build_sc_path):
+        with open(build_sc_path, "w") as f:
+            f.write(MILL_BATCH_BUILD_SC)
+    for name in ("chiselmodule", "generated_verilog", "obj_dir"):
+        shutil.rmtree(os.path.join(workspace_dir, name), ignore_errors=True)
+    for name in os.listdir(workspace_dir):
+        if name.endswith((".vcd", ".log", ".cpp")):
+            os.remove(os.path.join(workspace_dir, name))
 
 
 def run_compile_and_elaborate(
@@ -181,31 +280,11 @@ def run_compile_and_elaborate(
     result_dict["stage"] = "compilation"
     
     # 1. 创建 build.sc (定义 Chisel 依赖 - Mill 构建配置)
-    build_sc_content = """import mill._
-import mill.scalalib._
-
-object chiselmodule extends ScalaModule {
-  def scalaVersion = "2.13.12"
-  
-  def ivyDeps = Agg(
-    ivy"org.chipsalliance::chisel:6.0.0"
-  )
-  
-  def scalacOptions = Seq(
-    "-Xsource:2.13",
-    "-language:reflectiveCalls",
-    "-deprecation",
-    "-feature",
-    "-Xcheckinit"
-  )
-  
-  def scalacPluginIvyDeps = Agg(
-    ivy"org.chipsalliance:::chisel-plugin:6.0.0"
-  )
-}
-"""
-    with open(os.path.join(temp_dir, "build.sc"), "w") as f:
-        f.write(build_sc_content)
+    # 复用的工作区已有 build.sc，不重写，避免 Mill 重新编译构建脚本
+    build_sc_path = os.path.join(temp_dir, "build.sc")
+    if not os.path.exists(build_sc_path):
+        with open(build_sc_path, "w") as f:
+            f.write(MILL_BUILD_SC)
     
     # 2. 创建标准的 Mill 项目目录结构
     # Mill 默认使用 <module>/src/ 作为源码目录
@@ -249,19 +328,7 @@ object VerilogEmitter extends App {{
     stdout_log = os.path.join(temp_dir, 'mill_stdout.log')
     stderr_log = os.path.join(temp_dir, 'mill_stderr.log')
     
-    # 设置环境变量,配置 Mill 缓存
-    # Mill 的缓存机制更简洁，默认使用 ~/.cache/mill 和项目目录下的 out/
-    # 优化: 使用用户主目录下的缓存，避免重复下载依赖
-    user_home = os.path.expanduser("~")
-    mill_cache_dir = os.path.join(user_home, ".cache", "mill")
-    os.makedirs(mill_cache_dir, exist_ok=True)
-    
-    env = os.environ.copy()
-    # Mill 使用 COURSIER_CACHE 来配置依赖缓存位置
-    env['COURSIER_CACHE'] = mill_cache_dir
-    env['MILL_WORKSPACE_DIR'] = temp_dir
-    # 避免交互式提示
-    env['CI'] = 'true'
+    env = _mill_env(temp_dir)
     
     _log("⏳ 编译和阐述中 (使用 Mill)...", silent)
     
@@ -323,6 +390,379 @@ object VerilogEmitter extends App {{
     return verilog_file
 
 
+def _mill_env(temp_dir: str) -> dict:
+    """
+    辅助函数: 构造运行 Mill 的环境变量
+    
+    Mill 的缓存机制更简洁，默认使用 ~/.cache/mill 和项目目录下的 out/
+    优化: 使用用户主目录下的缓存，避免重复下载依赖
+    """
+    user_home = os.path.expanduser("~")
+    mill_cache_dir = os.path.join(user_home, ".cache", "mill")
+    os.makedirs(mill_cache_dir, exist_ok=True)
+    
+    env = os.environ.copy()
+    # Mill 使用 COURSIER_CACHE 来配置依赖缓存位置
+    env['COURSIER_CACHE'] = mill_cache_dir
+    env['MILL_WORKSPACE_DIR'] = temp_dir
+    # 避免交互式提示
+    env['CI'] = 'true'
+    return env
+
+
+# 批量阐述 Harness: 通过反射逐个实例化模块，单个模块阐述失败不影响其它模块。
+# 构造参数全部带默认值的模块 (如 class X(width: Int = 8)) 没有无参构造器，
+# 默认值从编译器生成的伴生对象方法 $lessinit$greater$default$N 取得
+BATCH_HARNESS_TEMPLATE = """import chisel3._
+import circt.stage.ChiselStage
+import java.io.PrintWriter
+import java.io.File
+
+object VerilogEmitter extends App {{
+  def instantiate(name: String): RawModule = {{
+    val ctor = Class.forName(name).getConstructors.minBy(_.getParameterCount)
+    val args: Array[Object] =
+      if (ctor.getParameterCount == 0) Array.empty[Object]
+      else {{
+        val companion = Class.forName(name + "$").getField("MODULE$").get(null)
+        (1 to ctor.getParameterCount).map {{ i =>
+          companion.getClass.getMethod("$lessinit$greater$default$" + i).invoke(companion)
+        }}.toArray
+      }}
+    ctor.newInstance(args: _*).asInstanceOf[RawModule]
+  }}
+
+  new File("generated_verilog").mkdirs()
+  for (name <- Seq({names})) {{
+    try {{
+      val verilog = ChiselStage.emitSystemVerilog(
+        instantiate(name),
+        firtoolOpts = Array("-disable-all-randomization", "-strip-debug-info")
+      )
+      val writer = new PrintWriter(new File(s"generated_verilog/$name.v"))
+      writer.write(verilog)
+      writer.close()
+      println(s"REFLECT_OK $name")
+    }} catch {{
+      case e: Throwable => println(s"REFLECT_FAIL $name")
+    }}
+  }}
+}}
+"""
+
+# 批量编译失败后剔除出错文件重新编译的最大轮数
+BATCH_MAX_COMPILE_ROUNDS = 4
+
+
+def reflect_batch(
+    candidates: List[Tuple[str, str]],
+    timeout: int = 300,
+    silent: bool = True,
+    workspace_dir: Optional[str] = None
+) -> List[Optional[bool]]:
+    """
+    批量反射: 在一次 Mill 调用 (一个 JVM) 中编译并阐述多个模块,
+    摊薄 JVM 启动、Scala 编译器和 Chisel 类加载的固定开销。
+    
+    每个候选写成独立的 .scala 文件 (各自的 import 互不干扰)，一起编译;
+    若有文件编译失败，根据编译器报错的文件名剔除后重新编译剩余文件。
+    只做编译 + 阐述，不做仿真。
+    
+    Args:
+        candidates (list): [(module_name, chisel_code), ...]，模块名必须互不相同
+        timeout (int): 单轮 Mill 调用的超时时间(秒)
+        silent (bool): 是否启用静默模式
+        workspace_dir (str, optional): 复用的 Mill 工作区目录。Mill 按工作区常驻后台
+            server (JVM)，同一进程反复使用同一工作区可免去每批的 JVM 冷启动;
+            用完后调用 close_workspace() 关闭。为 None 时使用一次性临时目录
+        
+    Returns:
+        list: 与 candidates 一一对应，True 表示编译和阐述均成功，False 表示编译器或阐述报错;
+            None 表示结论未知 (Mill 超时、编译失败但无法定位出错文件、JVM 中途退出等环境问题)，
+            调用方不应把 None 当作候选代码本身的失败
+    """
+    if workspace_dir is None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            return _run_batch(temp_dir, candidates, timeout, silent)
+    
+    os.makedirs(workspace_dir, exist_ok=True)
+    return _run_batch(workspace_dir, candidates, timeout, silent)
+
+
+def close_workspace(workspace_dir: str) -> None:
+    """
+    关闭 reflect / reflect_batch 复用的工作区: 停止其 Mill 后台 server 并删除目录
+    
+    Args:
+        workspace_dir (str): reflect 或 reflect_batch 使用过的工作区目录
+    """
+    try:
+        subprocess.run(
+            ["mill", "shutdown"],
+            cwd=workspace_dir,
+            capture_output=True,
+            env=_mill_env(workspace_dir),
+            timeout=30
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        pass
+    shutil.rmtree(workspace_dir, ignore_errors=True)
+
+
+def _run_batch(
+    work_dir: str,
+    candidates: List[Tuple[str, str]],
+    timeout: int,
+    silent: bool
+) -> List[Optional[bool]]:
+    """reflect_batch 的实际执行部分 (在给定工作区内编译并阐述一批候选)"""
+    # 未得到确定结论的候选保持 None
+    passed: Dict[str, Optional[bool]] = {name: None for name, _ in candidates}
+    remaining = dict(candidates)
+    
+    # build.sc 不变时不重写，避免 Mill 重新编译构建脚本
+    build_sc_path = os.path.join(work_dir, "build.sc")
+    if not os.path.exists(build_sc_path):
+        with open(build_sc_path, "w") as f:
+            f.write(MILL_BATCH_BUILD_SC)
+    
+    # 清理上一批的源文件和输出 (out/ 保留，Mill 增量编译和依赖解析结果可复用)
+    scala_dir = os.path.join(work_dir, "chiselmodule", "src")
+    shutil.rmtree(scala_dir, ignore_errors=True)
+    shutil.rmtree(os.path.join(work_dir, "generated_verilog"), ignore_errors=True)
+    os.makedirs(scala_dir, exist_ok=True)
+    for name, code in remaining.items():
+        with open(os.path.join(scala_dir, f"{name}.scala"), "w") as f:
+            # 与 reflect() 一致: 候选代码前补上 chisel3 导入
+            f.write(f"import chisel3._\n{code}")
+    
+    env = _mill_env(work_dir)
+    
+    for round_idx in range(BATCH_MAX_COMPILE_ROUNDS):
+        if not remaining:
+            break
+        
+        names = ", ".join(f'"{name}"' for name in remaining)
+        with open(os.path.join(scala_dir, "VerilogEmitter.scala"), "w") as f:
+            f.write(BATCH_HARNESS_TEMPLATE.format(names=names))
+        
+        _log(f"⏳ 批量编译和阐述 {len(remaining)} 个模块 (第 {round_idx + 1} 轮)...", silent)
+        try:
+            process = subprocess.run(
+                ["mill", "chiselmodule.run"],
+                cwd=work_dir,
+                capture_output=True,
+                text=True,
+                env=env,
+                timeout=timeout
+            )
+        except subprocess.TimeoutExpired:
+            _log("✗ 批量阐述超时", silent)
+            break
+        
+        # 编译通过: Harness 逐个输出阐述结果 (JVM 中途退出时未输出结果的候选仍为未知)
+        ok_names = set(re.findall(r"^REFLECT_OK (\w+)$", process.stdout, re.MULTILINE))
+        fail_names = set(re.findall(r"^REFLECT_FAIL (\w+)$", process.stdout, re.MULTILINE))
+        if ok_names or fail_names or process.returncode == 0:
+            for name in remaining:
+                if name in ok_names:
+                    passed[name] = True
+                elif name in fail_names:
+                    passed[name] = False
+            break
+        
+        # 编译失败: 剔除报错的候选文件后重试
+        failed_files = {
+            name for name in re.findall(r"(\w+)\.scala:\d+", process.stderr)
+            if name in remaining
+        }
+        if not failed_files:
+            _log("✗ 批量编译失败且无法定位出错文件", silent)
+            break
+        for name in failed_files:
+            passed[name] = False
+            del remaining[name]
+            os.remove(os.path.join(scala_dir, f"{name}.scala"))
+        _log(f"✗ {len(failed_files)} 个模块编译失败，剔除后重试", silent)
+    
+    return [passed[name] for name, _ in candidates]
+
+
+# 仿真程序编译缓存: 以 Verilog + testbench 内容为键，相同设计不再重复 Verilator 与 C++ 编译
+VERILATOR_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "chisellm", "verilator")
+
+# 缓存条目数上限 (每个条目是一份完整的 obj_dir，通常数 MB)，超出时按最近使用时间淘汰最旧的条目
+VERILATOR_CACHE_MAX_ENTRIES = 256
+
+# 编译中的临时目录超过该时长 (秒) 仍未完成，视为异常退出的进程遗留，清理时一并删除
+VERILATOR_STAGING_MAX_AGE = 3600
+
+# Verilator 参数 (同时计入缓存键，参数变化后旧的编译结果自动失效)
+VERILATOR_FLAGS = (
+    "-cc",                  # 生成 C++ 代码
+    "--trace",              # 启用 VCD 波形生成
+    "-Wno-UNUSED",          # 忽略未使用信号的警告
+    "-Wno-lint",            # 忽略 lint 警告
+    "--exe",                # 创建可执行文件
+    "-O3",                  # 最高优化级别
+    "--x-assign", "fast",   # X 赋值按最快方式处理 (不模拟 X 传播)
+    "--x-initial", "fast",  # 未初始化变量同上
+)
+
+# 生成的 C++ 的编译优化: 热路径 -O2，只执行一次的初始化等冷代码 -O0 以缩短编译时间
+VERILATOR_MAKE_FLAGS = ("OPT_FAST=-O2", "OPT_SLOW=-O0")
+
+# Verilog 超过该行数时启用多线程仿真；小设计的线程启动和同步开销大于收益
+VERILATOR_THREADS_MIN_LINES = 500
+VERILATOR_MAX_THREADS = 4
+
+
+def _verilator_flags(verilog_bytes: bytes) -> Tuple[str, ...]:
+    """按设计规模确定 Verilator 参数: 大设计追加 --threads"""
+    if verilog_bytes.count(b"\n") <= VERILATOR_THREADS_MIN_LINES:
+        return VERILATOR_FLAGS
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        # 非 Linux 平台没有 sched_getaffinity
+        cpus = os.cpu_count() or 1
+    threads = min(cpus, VERILATOR_MAX_THREADS)
+    if threads < 2:
+        return VERILATOR_FLAGS
+    return VERILATOR_FLAGS + ("--threads", str(threads))
+
+
+def _simulation_cache_key(
+    module_name: str,
+    verilator_flags: Tuple[str, ...],
+    verilog_bytes: bytes,
+    tb_bytes: bytes
+) -> str:
+    """仿真编译缓存键: 模块名、Verilator 与 make 参数 (含线程数)、Verilog 与 testbench 内容的 SHA-256"""
+    h = hashlib.sha256()
+    flags = " ".join(verilator_flags + VERILATOR_MAKE_FLAGS)
+    for part in (module_name.encode("utf-8"), flags.encode("utf-8"), verilog_bytes, tb_bytes):
+        h.update(len(part).to_bytes(8, "little"))
+        h.update(part)
+    return h.hexdigest()
+
+
+def _build_simulation(
+    build_dir: str,
+    verilog_bytes: bytes,
+    verilog_name: str,
+    tb_bytes: bytes,
+    tb_name: str,
+    module_name: str,
+    verilator_flags: Tuple[str, ...],
+    result_dict: dict,
+    silent: bool
+) -> bool:
+    """
+    辅助函数: 用 Verilator + make 编译仿真程序并存入缓存目录 build_dir
+    
+    先在同级的临时目录中编译，成功后整体重命名为 build_dir，
+    并发的进程不会看到编译了一半的缓存项。
+    
+    Returns:
+        bool: 编译是否成功 (失败时错误信息写入 result_dict)
+    """
+    os.makedirs(VERILATOR_CACHE_DIR, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix="build_", dir=VERILATOR_CACHE_DIR)
+    try:
+        tb_dest_path = os.path.join(staging_dir, tb_name)
+        with open(tb_dest_path, "wb") as f:
+            f.write(tb_bytes)
+        verilog_dest_path = os.path.join(staging_dir, verilog_name)
+        with open(verilog_dest_path, "wb") as f:
+            f.write(verilog_bytes)
+        
+        _log("⏳ Verilator 编译中...", silent)
+        
+        # 2. 运行 Verilator (Verilog -> C++)
+        verilator_cmd = ["verilator", *verilator_flags, tb_dest_path, verilog_dest_path]
+        
+        process = subprocess.run(
+            verilator_cmd,
+            cwd=staging_dir,
+            capture_output=True,
+            text=True,
+            timeout=60
+        )
+        
+        if process.returncode != 0:
+            result_dict["error_log"] = f"Verilator Error:\n{process.stderr}"
+            _log("✗ Verilator 编译失败", silent)
+            return False
+        
+        _log("✓ Verilator 编译成功", silent)
+        _log("⏳ C++ 编译中...", silent)
+        
+        # 3. 编译 C++ (使用 make)
+        obj_dir = os.path.join(staging_dir, "obj_dir")
+        make_cmd = [
+            "make",
+            "-C", obj_dir,
+            "-f", f"V{module_name}.mk",
+            *VERILATOR_MAKE_FLAGS,
+            f"V{module_name}"
+        ]
+        
+        process = subprocess.run(
+            make_cmd,
+            cwd=staging_dir,
+            capture_output=True,
+            text=True,
+            timeout=60
+        )
+        
+        if process.returncode != 0:
+            result_dict["error_log"] = f"Make Error:\n{process.stderr}"
+            _log("✗ C++ 编译失败", silent)
+            return False
+        
+        _log("✓ C++ 编译成功", silent)
+        
+        try:
+            os.rename(staging_dir, build_dir)
+        except OSError:
+            # 其它进程已经存入了同一缓存项，使用已有的即可
+            pass
+        _prune_simulation_cache()
+        return True
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def _prune_simulation_cache() -> None:
+    """
+    辅助函数: 控制仿真编译缓存的大小
+    
+    按目录 mtime (命中时会刷新) 淘汰最久未使用的条目，直到不超过 VERILATOR_CACHE_MAX_ENTRIES;
+    同时删除超时未完成的编译临时目录。
+    """
+    now = time.time()
+    entries = []
+    for name in os.listdir(VERILATOR_CACHE_DIR):
+        path = os.path.join(VERILATOR_CACHE_DIR, name)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            continue  # 已被其它进程删除
+        if name.startswith("build_"):
+            # 其它进程正在编译的目录不动，只清理遗留的
+            if now - mtime > VERILATOR_STAGING_MAX_AGE:
+                shutil.rmtree(path, ignore_errors=True)
+            continue
+        entries.append((mtime, path))
+    
+    if len(entries) <= VERILATOR_CACHE_MAX_ENTRIES:
+        return
+    entries.sort()
+    for _, path in entries[:len(entries) - VERILATOR_CACHE_MAX_ENTRIES]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
 def run_simulation(
     temp_dir: str, 
     verilog_file_path: str, 
@@ -335,10 +775,10 @@ def run_simulation(
     步骤 2: 使用 Verilator 编译和运行 C++ testbench
     
     这个函数会:
-    1. 复制用户提供的 C++ testbench
+    1. 按 Verilog + testbench 内容查找编译缓存 (命中则跳过 2、3)
     2. 使用 Verilator 将 Verilog 转换为 C++
     3. 编译生成的 C++ 代码
-    4. 运行可执行文件并检查测试结果
+    4. 运行可执行文件，以退出码判断测试结果 (0 为通过)
     
     Args:
         temp_dir (str): 临时工作目录路径
@@ -350,99 +790,62 @@ def run_simulation(
     
     result_dict["stage"] = "simulation"
     
-    # 1. 复制 testbench 文件
-    tb_filename = os.path.basename(testbench_path)
-    tb_dest_path = os.path.join(temp_dir, tb_filename)
-    shutil.copy(testbench_path, tb_dest_path)
-    
-    _log("⏳ Verilator 编译中...", silent)
-    
-    # 2. 运行 Verilator (Verilog -> C++)
-    verilator_cmd = [
-        "verilator",
-        "-cc",                  # 生成 C++ 代码
-        "--trace",              # 启用 VCD 波形生成
-        "-Wno-UNUSED",          # 忽略未使用信号的警告
-        "-Wno-lint",            # 忽略 lint 警告
-        "--exe",                # 创建可执行文件
-        tb_dest_path,           # C++ testbench
-        verilog_file_path       # Verilog 文件
-    ]
-    
-    process = subprocess.run(
-        verilator_cmd,
-        cwd=temp_dir,
-        capture_output=True,
-        text=True,
-        timeout=60
-    )
-    
-    if process.returncode != 0:
-        result_dict["error_log"] = f"Verilator Error:\n{process.stderr}"
-        _log("✗ Verilator 编译失败", silent)
-        return
-    
-    _log("✓ Verilator 编译成功", silent)
-    _log("⏳ C++ 编译中...", silent)
-    
-    # 3. 编译 C++ (使用 make)
-    obj_dir = os.path.join(temp_dir, "obj_dir")
-    make_cmd = [
-        "make",
-        "-C", obj_dir,
-        "-f", f"V{module_name}.mk",
-        f"V{module_name}"
-    ]
-    
-    process = subprocess.run(
-        make_cmd,
-        cwd=temp_dir,
-        capture_output=True,
-        text=True,
-        timeout=60
+    # 1. 按 Verilog + testbench 内容查找已编译的仿真程序
+    with open(verilog_file_path, "rb") as f:
+        verilog_bytes = f.read()
+    with open(testbench_path, "rb") as f:
+        tb_bytes = f.read()
+    verilator_flags = _verilator_flags(verilog_bytes)
+    build_dir = os.path.join(
+        VERILATOR_CACHE_DIR, _simulation_cache_key(module_name, verilator_flags, verilog_bytes, tb_bytes)
     )
+    exe_path = os.path.join(build_dir, "obj_dir", f"V{module_name}")
     
-    if process.returncode != 0:
-        result_dict["error_log"] = f"Make Error:\n{process.stderr}"
-        _log("✗ C++ 编译失败", silent)
-        return
+    if os.path.exists(exe_path):
+        # 刷新 mtime，缓存按最近使用时间淘汰
+        try:
+            os.utime(build_dir)
+        except OSError:
+            pass
+        _log("✓ 命中仿真编译缓存，跳过 Verilator 与 C++ 编译", silent)
+    else:
+        # 2-3. 未命中: Verilator + make 编译，结果存入缓存
+        if not _build_simulation(
+            build_dir, verilog_bytes, os.path.basename(verilog_file_path),
+            tb_bytes, os.path.basename(testbench_path), module_name, verilator_flags, result_dict, silent
+        ):
+            return
     
-    _log("✓ C++ 编译成功", silent)
     _log("⏳ 运行仿真...", silent)
     
-    # 4. 运行可执行文件
-    exe_path = os.path.join(obj_dir, f"V{module_name}")
-    
-    process = subprocess.run(
-        [exe_path],
-        cwd=temp_dir,
-        capture_output=True,
-        text=True,
-        timeout=10
-    )
-    
-    if process.returncode != 0:
-        # 收集完整的错误信息 (stdout + stderr)
-        error_info = f"Simulation Runtime Error (exit code {process.returncode}):\n"
-        if process.stdout:
-            error_info += f"[stdout]:\n{process.stdout}\n"
-        if process.stderr:
-            error_info += f"[stderr]:\n{process.stderr}\n"
-        result_dict["error_log"] = error_info
-        result_dict["sim_passed"] = False
-        _log("✗ 仿真运行时错误", silent)
-        # 即使失败，也尝试读取 VCD 文件（可能部分生成）
-        _try_read_vcd(temp_dir, result_dict, silent)
-        return
-    
-    # 5. 检查 testbench 输出
-    sim_output = process.stdout
-    if "TEST PASSED" in sim_output or "PASS" in sim_output:
+    # 4. 运行可执行文件 (在本次调用的工作目录中运行，波形文件写在这里)
+    # testbench 约定以退出码表示结果 (0 为通过)，stdout 直接写入日志文件，
+    # 只在失败时读回作为错误信息，不经管道搬运整个仿真输出
+    sim_log_path = os.path.join(temp_dir, "sim_stdout.log")
+    with open(sim_log_path, "wb") as sim_log:
+        process = subprocess.run(
+            [exe_path],
+            cwd=temp_dir,
+            stdout=sim_log,
+            stderr=subprocess.PIPE,
+            timeout=10
+        )
+    
+    # 5. 检查退出码
+    if process.returncode == 0:
         result_dict["sim_passed"] = True
         _log("✓ 仿真测试通过", silent)
     else:
+        # 收集错误信息 (stdout + stderr)
+        sim_stdout = _tail(sim_log_path)
+        sim_stderr = process.stderr.decode("utf-8", "replace")
+        error_info = f"Simulation Test Failed (exit code {process.returncode}):\n"
+        if sim_stdout:
+            error_info += f"[stdout]:\n{sim_stdout}\n"
+        if sim_stderr:
+            error_info += f"[stderr]:\n{sim_stderr}\n"
+        result_dict["error_log"] = error_info
         result_dict["sim_passed"] = False
-        result_dict["error_log"] = f"Simulation Test Failed:\n{sim_output}"
         _log("✗ 仿真测试失败", silent)
     
     # 6. 读取 VCD 波形文件
@@ -472,9 +875,21 @@ def _try_read_vcd(temp_dir: str, result_dict: dict, silent: bool) -> None:
             pass
 
 
+# 失败时附带的日志只取末尾部分: 依赖解析等输出可达数十 MB，报错信息通常在最后
+LOG_TAIL_BYTES = 8192
+
+
+def _tail(path: str, n: int = LOG_TAIL_BYTES) -> str:
+    """辅助函数: 读取文件最后 n 个字节 (按 UTF-8 解码，截断处的残缺字符被替换)"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - n))
+        return f.read().decode('utf-8', 'replace')
+
+
 def _read_logs(temp_dir: str, result_dict: dict) -> None:
     """
-    辅助函数: 读取日志文件到结果字典
+    辅助函数: 读取日志文件末尾到结果字典
     
     Args:
         temp_dir (str): 临时目录路径
@@ -482,17 +897,13 @@ def _read_logs(temp_dir: str, result_dict: dict) -> None:
     """
     # 读取 stderr 日志
     try:
-        stderr_log = os.path.join(temp_dir, 'mill_stderr.log')
-        with open(stderr_log, 'r') as f:
-            result_dict['full_stderr'] = f.read()
+        result_dict['full_stderr'] = _tail(os.path.join(temp_dir, 'mill_stderr.log'))
     except IOError:
         pass  # 文件不存在也没关系
     
     # 读取 stdout 日志
     try:
-        stdout_log = os.path.join(temp_dir, 'mill_stdout.log')
-        with open(stdout_log, 'r') as f:
-            result_dict['full_stdout'] = f.read()
+        result_dict['full_stdout'] = _tail(os.path.join(temp_dir, 'mill_stdout.log'))
     except IOError:
         pass
 
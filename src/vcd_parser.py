@@ -9,12 +9,12 @@ ChiseLLM VCD 解析器与波形可视化
 """
 
 from vcdvcd import VCDVCD
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, TextIO, Union
 import json
 
 
 def vcd_to_wavedrom(
-    vcd_file: str,
+    vcd_file: Union[str, TextIO],
     signals: Optional[List[str]] = None,
     max_cycles: int = 30,
     clock_signal: str = "clock"
@@ -23,7 +23,7 @@ def vcd_to_wavedrom(
     将 VCD 文件转换为 WaveDrom JSON 格式
     
     Args:
-        vcd_file: VCD 文件路径
+        vcd_file: VCD 文件路径，或包含 VCD 文本的流 (如 io.StringIO，免去临时文件)
         signals: 要显示的信号列表 (None 表示全部)
         max_cycles: 最大显示周期数 (默认 30，适合显示)
         clock_signal: 时钟信号名称
@@ -32,7 +32,10 @@ def vcd_to_wavedrom(
         WaveDrom JSON 格式的字典
     """
     try:
-        vcd = VCDVCD(vcd_file)
+        if hasattr(vcd_file, "read"):
+            vcd = VCDVCD(vcd_string=vcd_file.read())
+        else:
+            vcd = VCDVCD(vcd_file)
     except Exception as e:
         return {"error": f"无法解析 VCD 文件: {str(e)}"}
     